@@ -0,0 +1,109 @@
+# Timing of the mobility engines against the original per-person loops on the full panel.
+#
+#   python benchmark.py dream_92.csv
+#
+# Every timed pair is also checked for identical counts/IDs.
+import sys
+import time
+
+import numpy as np
+
+import dataset
+import mobility
+
+PERIODS = [(1968, 1995), (1996, 2022)]
+
+
+def timed(fn, *args, repeat=1, **kwargs):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def clear_stage_caches():
+    for stage in (mobility.start_stage, mobility.goal_stage, mobility.window_stage, mobility._between):
+        stage.cache_clear()
+
+
+def bench_ever_reached(df, panel, start_range=("lowest",), goal_range=("top",)):
+    def loops():
+        return [mobility.ever_reached_reference(df[df['year'].between(*p)], list(start_range), list(goal_range))
+                for p in PERIODS]
+
+    def one_pass():
+        clear_stage_caches()
+        return mobility.ever_reached_periods(panel, start_range, goal_range, PERIODS)
+
+    old, t_old = timed(loops)
+    new, t_new = timed(one_pass, repeat=5)
+    for (r0, n0, ids0), (r1, n1, ids1) in zip(old, new):
+        assert (r0, n0) == (r1, n1) and sorted(ids0) == list(ids1), "ever_reached mismatch"
+    print(f"ever_reached, both periods: loops {t_old * 1e3:9.1f} ms | one pass {t_new * 1e3:7.2f} ms "
+          f"| x{t_old / t_new:,.0f}")
+
+
+def bench_robust_periods(panel, start_range=("lowest",), goal_range=("top",), time_horizon=5, consec_years=3):
+    # Rolling decades every two years, as in the Ever Reached tab's "Rolling windows" mode
+    periods = mobility.rolling_periods(panel.years[0], panel.years[-1], 10, 2)
+
+    def per_period():
+        clear_stage_caches()
+        return [mobility.robust_achievers(panel, start_range, goal_range, time_horizon, consec_years, year_range=p)
+                for p in periods]
+
+    def one_pass():
+        clear_stage_caches()
+        return mobility.robust_periods(panel, start_range, goal_range, time_horizon, consec_years, periods)
+
+    old, t_old = timed(per_period, repeat=3)
+    new, t_new = timed(one_pass, repeat=3)
+    for (ids0, n0, t0, _), (n1, t1, ids1) in zip(old, new):
+        assert (n0, t0) == (n1, t1) and (ids0.bits == ids1.bits).all(), "robust_periods mismatch"
+    print(f"robust mobility, {len(periods)} rolling windows: per period {t_old * 1e3:9.1f} ms | one pass "
+          f"{t_new * 1e3:7.2f} ms | x{t_old / t_new:,.1f}")
+
+
+def bench_surface(panel, start_range=("lowest",), goal_range=("top",), max_horizon=40, max_window=15):
+    # The hope.py sweep: every sidebar time horizon x robustness window
+    def per_cell():
+        clear_stage_caches()
+        return [[mobility.robust_achievers(panel, start_range, goal_range, h, c)[1:3]
+                 for c in range(1, max_window + 1)] for h in range(1, max_horizon + 1)]
+
+    def one_pass():
+        clear_stage_caches()
+        mobility.goal_runs.cache_clear()
+        return mobility.robust_surface(panel, start_range, goal_range, max_horizon, max_window)
+
+    old, t_old = timed(per_cell)
+    (n_achievers, n_total), t_new = timed(one_pass, repeat=3)
+    assert (np.array(old) == np.stack([n_achievers, n_total], axis=-1)).all(), "robust_surface mismatch"
+    print(f"robust mobility, {max_horizon}x{max_window} sweep: per cell {t_old * 1e3:9.1f} ms | one pass "
+          f"{t_new * 1e3:7.2f} ms | x{t_old / t_new:,.1f}")
+
+
+def bench_ranks(df):
+    def grouped():
+        income = df[dataset.INCOME_COL].astype('float64').groupby(df['year'])
+        return ((income.rank(method='average') - 0.5) / income.transform('count')).to_numpy()
+
+    old, t_old = timed(grouped)
+    new, t_new = timed(dataset.percentile_ranks, df, repeat=3)
+    assert np.allclose(old, new, equal_nan=True), "percentile_ranks mismatch"
+    print(f"percentile ranks: groupby rank {t_old * 1e3:9.1f} ms | one sort {t_new * 1e3:7.2f} ms "
+          f"| x{t_old / t_new:,.1f}")
+
+
+if __name__ == "__main__":
+    data_path = sys.argv[1] if len(sys.argv) > 1 else "dream_92.csv"
+    df = dataset.load_frame(data_path)
+    panel = mobility.build_panel(df)
+    print(f"{data_path}: {len(df):,} rows, {len(panel.ids):,} people, {panel.n_years} years")
+    bench_ever_reached(df, panel)
+    bench_robust_periods(panel)
+    bench_surface(panel)
+    bench_ranks(df)
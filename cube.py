@@ -0,0 +1,176 @@
+# Offline mobility lookup cube for the hope.py Mobility Calculator.
+#
+#   python cube.py dream_92.csv
+#
+# precomputes n_achievers / n_total for every "All years" sidebar combination (start range x goal range x
+# robustness window x time horizon) into dream_92_cube/, plus the achiever IDs of every cell as
+# zlib-compressed bitmaps over the panel's person codes. The dashboard answers from the cube in O(1) and
+# falls back to the live engine when it is stale/missing; a single start year always goes to the engine's
+# cohort pushdown, which only reads that year's cohort.
+import json
+import os
+import sys
+
+import numpy as np
+
+import dataset
+import mobility
+from mobility import MAX_HORIZON, MAX_WINDOW
+
+CUBE_VERSION = 2
+
+
+def cube_dir(path):
+    return os.path.splitext(path)[0] + "_cube"
+
+
+def cube_stamp(path):
+    # (mtime, size) of the cube's CURRENT pointer, None when there is no cube: a cache key that changes
+    # whenever `python cube.py` publishes a rebuilt cube
+    try:
+        st = os.stat(os.path.join(cube_dir(path), dataset.CURRENT))
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def sidebar_ranges(quintile_options=mobility.QUINTILE_OPTIONS):
+    # Every distinct range the sidebar's quintile x comparison selectboxes can produce
+    ranges = set()
+    for i, q in enumerate(quintile_options):
+        ranges |= {(q,), tuple(quintile_options[:i + 1]), tuple(quintile_options[i:])}
+    return sorted(ranges, key=lambda r: (len(r), [quintile_options.index(q) for q in r]))
+
+
+def build_cube(panel):
+    opts = list(panel.quintile_options)
+    start_ranges = sidebar_ranges(opts)
+    # A goal range covering every quintile is rejected by the dashboard
+    goal_ranges = [r for r in start_ranges if len(r) < len(opts)]
+    n_people, n_years = panel.codes.shape
+    horizons = np.arange(1, MAX_HORIZON + 1)
+    shape = (len(start_ranges), len(goal_ranges), MAX_WINDOW, MAX_HORIZON)
+    achievers = np.zeros(shape, dtype=np.int32)
+    denominators = np.zeros((len(start_ranges), MAX_WINDOW, MAX_HORIZON), dtype=np.int32)
+    id_blobs = []
+    id_offsets = np.zeros(shape + (2,), dtype=np.int64)
+
+    last = mobility.last_column(panel)
+    spans = horizons[None, :] + np.arange(MAX_WINDOW)[:, None]       # (window, horizon) -> H + C - 1
+    cols = np.arange(n_years)
+
+    start_bits = []
+    for si, s in enumerate(start_ranges):
+        bits, first_start = mobility.start_stage(panel, s)
+        start_bits.append(bits)
+        # Denominators only depend on the start range and span = horizon + window - 1, and the earliest
+        # start decides: by_first[t, l] = # people first starting at t whose last observed column is >= l
+        has = first_start >= 0
+        first_hist = np.zeros((n_years, n_years), dtype=np.int64)
+        np.add.at(first_hist, (first_start[has], last[has]), 1)
+        by_first = np.cumsum(first_hist[:, ::-1], axis=1)[:, ::-1]
+        ends = cols[None, None, :] + spans[:, :, None]
+        ok = ends < n_years
+        denominators[si] = np.where(ok, by_first[cols, np.minimum(ends, n_years - 1)], 0).sum(axis=2)
+
+    shifts = horizons.astype(np.uint64)
+    cursor = 0
+    for gi, g in enumerate(goal_ranges):
+        for c in range(1, MAX_WINDOW + 1):
+            shifted = mobility.window_stage(panel, g, c)[:, None] >> shifts[None, :]    # (people, horizon)
+            for si, bits in enumerate(start_bits):
+                hits = (bits[:, None] & shifted) != 0
+                achievers[si, gi, c - 1] = hits.sum(axis=0)
+                for hi in range(MAX_HORIZON):
+                    blob = mobility.PersonSet.from_mask(panel.ids, hits[:, hi]).to_bytes()
+                    id_offsets[si, gi, c - 1, hi] = (cursor, cursor + len(blob))
+                    id_blobs.append(blob)
+                    cursor += len(blob)
+    return {
+        "start_ranges": start_ranges, "goal_ranges": goal_ranges,
+        "achievers": achievers, "denominators": denominators,
+        "id_offsets": id_offsets, "id_blob": b"".join(id_blobs),
+    }
+
+
+def save_cube(cube, cdir, source_sha1, panel):
+    # Same versioned-directory + CURRENT pointer swap as the binary data cache (dataset.publish_version):
+    # a dashboard that is serving never sees a missing or half-written cube
+    tmp = dataset.version_tmpdir(cdir)
+    for name in ("achievers", "denominators", "id_offsets"):
+        np.save(os.path.join(tmp, f"{name}.npy"), cube[name])
+    with open(os.path.join(tmp, "ids.bin"), "wb") as f:
+        f.write(cube["id_blob"])
+    meta = {"version": CUBE_VERSION, "source_sha1": source_sha1,
+            "n_people": int(panel.codes.shape[0]), "first_year": int(panel.years[0]),
+            "n_years": int(panel.n_years), "quintile_options": list(panel.quintile_options),
+            "start_ranges": [list(r) for r in cube["start_ranges"]],
+            "goal_ranges": [list(r) for r in cube["goal_ranges"]]}
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    dataset.publish_version(cdir, tmp)
+
+
+def _read_cube(vdir, panel, source_sha1):
+    # The cube stored in one version directory, or None when it was built from other data
+    try:
+        with open(os.path.join(vdir, "meta.json")) as f:
+            meta = json.load(f)
+    except ValueError:
+        return None
+    current = (meta.get("version") == CUBE_VERSION
+               and meta["source_sha1"] == source_sha1
+               and meta["n_people"] == panel.codes.shape[0]
+               and meta["n_years"] == panel.n_years
+               and (not panel.n_years or meta["first_year"] == int(panel.years[0]))
+               and meta["quintile_options"] == list(panel.quintile_options))
+    if not current:
+        return None
+    cube = {name: np.load(os.path.join(vdir, f"{name}.npy"), mmap_mode='r')
+            for name in ("achievers", "denominators", "id_offsets")}
+    cube["id_blob"] = np.memmap(os.path.join(vdir, "ids.bin"), dtype=np.uint8, mode='r') \
+        if os.path.getsize(os.path.join(vdir, "ids.bin")) else np.zeros(0, dtype=np.uint8)
+    cube["start_index"] = {tuple(r): i for i, r in enumerate(meta["start_ranges"])}
+    cube["goal_index"] = {tuple(r): i for i, r in enumerate(meta["goal_ranges"])}
+    return cube
+
+
+def open_cube(path, panel):
+    # Memory-mapped cube for this data file, or None when it is missing or was built from other data
+    cdir = cube_dir(path)
+    source_sha1 = None
+    for _ in range(dataset.CACHE_RETRIES):
+        vdir = dataset.current_version(cdir)
+        if vdir is None:
+            return None
+        source_sha1 = source_sha1 or dataset.source_hash(path)
+        try:
+            return _read_cube(vdir, panel, source_sha1)
+        except FileNotFoundError:
+            # `python cube.py` swapped in a rebuild and pruned this version meanwhile: resolve CURRENT again
+            continue
+    return None
+
+
+def lookup(cube, panel, start_quintile_range, goal_quintile_range, time_horizon, consec_years):
+    # -> (achiever PersonSet, n_achievers, n_total) for "All years", or None when the cube cannot answer
+    if cube is None:
+        return None
+    si = cube["start_index"].get(tuple(start_quintile_range))
+    gi = cube["goal_index"].get(tuple(goal_quintile_range))
+    h, c = int(time_horizon), int(consec_years)
+    if si is None or gi is None or not (1 <= h <= MAX_HORIZON and 1 <= c <= MAX_WINDOW):
+        return None
+    n_achievers = int(cube["achievers"][si, gi, c - 1, h - 1])
+    n_total = int(cube["denominators"][si, c - 1, h - 1])
+    lo, hi = cube["id_offsets"][si, gi, c - 1, h - 1]
+    ids = mobility.PersonSet.from_bytes(panel.ids, cube["id_blob"][lo:hi].tobytes(), n_achievers)
+    return ids, n_achievers, n_total
+
+
+if __name__ == "__main__":
+    data_path = sys.argv[1] if len(sys.argv) > 1 else "dream_92.csv"
+    panel = mobility.build_panel(dataset.load_frame(data_path))
+    cube = build_cube(panel)
+    save_cube(cube, cube_dir(data_path), dataset.source_hash(data_path), panel)
+    print(f"Wrote {cube_dir(data_path)} ({cube['achievers'].size} cells, {len(cube['id_blob']) / 1e6:.1f} MB of ID bitmaps)")
@@ -0,0 +1,548 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from mobility import QUINTILE_OPTIONS, PersonSet
+
+# Bump whenever the on-disk layout or the dtype rules below change
+CACHE_VERSION = 4
+
+# Census quintile thresholds that clean.R joins onto every person-year row; they only vary by year
+THRESHOLD_COLS = ['Lowest', 'Second', 'Third', 'Fourth', 'Lower.limit.of.top.5.percent..dollars.']
+
+
+# --- dtype-optimized schema ---
+def optimize_dtypes(df):
+    # Shrink the raw read_csv frame: categorical labels/ids, int16 year, float32 incomes,
+    # smallest integer type for everything else
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if col == 'quintile_label':
+            extra = sorted(set(s.dropna().unique()) - set(QUINTILE_OPTIONS))
+            out[col] = pd.Categorical(s, categories=QUINTILE_OPTIONS + extra)
+        elif col == 'year' and not s.isna().any():
+            out[col] = s.astype(np.int16)
+        elif pd.api.types.is_bool_dtype(s):
+            out[col] = s
+        elif pd.api.types.is_float_dtype(s):
+            out[col] = s.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(s):
+            out[col] = pd.to_numeric(s, downcast='integer')
+        else:
+            # family_person and any other string column -> integer codes + unique labels
+            out[col] = s.astype('category')
+    return pd.DataFrame(out, index=df.index)
+
+
+def split_thresholds(df):
+    # -> (df without the threshold columns, one row per year with each threshold)
+    cols = [col for col in THRESHOLD_COLS if col in df.columns]
+    thresholds = df.groupby('year', as_index=False, sort=True)[cols].mean()
+    thresholds = thresholds.astype({'year': np.int64, **{col: np.float64 for col in cols}})
+    return df.drop(columns=cols), thresholds
+
+
+def sort_rows(df):
+    # Rows grouped by person (sorted ids) then year, so every trajectory is a contiguous block
+    pid_codes, _ = pd.factorize(df['family_person'], sort=True)
+    order = np.lexsort((df['year'].to_numpy(), pid_codes))
+    return df.take(order).reset_index(drop=True)
+
+
+# --- Per-person trajectory index ---
+@dataclass(frozen=True, eq=False)
+class PersonIndex:
+    # Built ONCE per frame: a person's rows are frame.iloc[offsets[i]:offsets[i + 1]] for ids[i], a
+    # zero-copy slice of the (memory-mapped) columns instead of a full-table family_person scan.
+    frame: pd.DataFrame       # rows sorted by family_person then year
+    ids: np.ndarray           # sorted family_person ids
+    offsets: np.ndarray       # int64, len(ids) + 1
+    years: np.ndarray         # frame['year'] as a plain array, for year-range trims
+
+    def rows(self, pid, year_range=None):
+        # One person's rows (sorted by year), optionally trimmed to year_range = (first, last)
+        i = int(np.searchsorted(self.ids, pid))
+        if i >= len(self.ids) or self.ids[i] != pid:
+            return self.frame.iloc[0:0]
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+        if year_range is not None:
+            block = self.years[lo:hi]
+            lo, hi = lo + int(np.searchsorted(block, year_range[0])), \
+                lo + int(np.searchsorted(block, year_range[1], side='right'))
+        return self.frame.iloc[lo:hi]
+
+    def observed_mask(self, lo, hi):
+        # Boolean over ids: at least one row in years lo..hi
+        inside = ((self.years >= lo) & (self.years <= hi)).astype(np.int64)
+        return np.diff(np.concatenate(([0], np.cumsum(inside)))[self.offsets]) > 0
+
+    def observed_between(self, lo, hi):
+        # ids with at least one row in years lo..hi
+        return self.ids[self.observed_mask(lo, hi)]
+
+    def id_mask(self, pids):
+        # Boolean over ids: id is one of pids (e.g. an achiever set from another panel); a PersonSet is
+        # read from its bitmap instead of being expanded into an id list
+        if isinstance(pids, PersonSet):
+            return pids.mask_over(self.ids)
+        pids = np.asarray(pids, dtype=self.ids.dtype)
+        mask = np.zeros(len(self.ids), dtype=bool)
+        if len(self.ids) and len(pids):
+            i = np.minimum(np.searchsorted(self.ids, pids), len(self.ids) - 1)
+            mask[i[self.ids[i] == pids]] = True
+        return mask
+
+    def search(self, text, mask=None, limit=50):
+        # -> (first `limit` ids starting with text, # matches). ids are sorted, so the prefix matches are
+        # one contiguous block found by two binary searches; mask (boolean over ids) applies filters
+        text = str(text).strip()
+        lo, hi = 0, len(self.ids)
+        if text:
+            lo, hi = int(np.searchsorted(self.ids, text)), int(np.searchsorted(self.ids, text + "\uffff"))
+        hits = np.arange(lo, hi) if mask is None else lo + np.flatnonzero(mask[lo:hi])
+        return self.ids[hits[:limit]], len(hits)
+
+    def rows_many(self, pids, year_range=None):
+        # Several people's rows stacked in the given order (only these small blocks are copied)
+        parts = [self.rows(pid, year_range) for pid in pids]
+        return pd.concat(parts) if parts else self.frame.iloc[0:0]
+
+    def positions(self, pids, year_range=None):
+        # -> (row positions of several people's blocks stacked in the given order, # rows per person),
+        # one vectorized gather for hundreds of people instead of a frame per person; unknown ids get 0 rows
+        pids = np.asarray(pids, dtype=self.ids.dtype)
+        i = np.minimum(np.searchsorted(self.ids, pids), max(len(self.ids) - 1, 0))
+        found = (self.ids[i] == pids) if len(self.ids) else np.zeros(len(pids), dtype=bool)
+        lo = self.offsets[i]
+        lengths = np.where(found, self.offsets[i + 1] - lo, 0) if len(self.ids) else np.zeros(len(pids), np.int64)
+        owner = np.repeat(np.arange(len(pids)), lengths)
+        pos = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(len(owner))
+        if year_range is not None:
+            keep = (self.years[pos] >= year_range[0]) & (self.years[pos] <= year_range[1])
+            pos, owner = pos[keep], owner[keep]
+            lengths = np.bincount(owner, minlength=len(pids))
+        return pos, lengths
+
+
+def person_index(df):
+    pid_codes, ids = pd.factorize(df['family_person'], sort=True)
+    years = df['year'].to_numpy()
+    if len(df) > 1:
+        d_pid, d_year = np.diff(pid_codes), np.diff(years)
+        if not ((d_pid > 0) | ((d_pid == 0) & (d_year >= 0))).all():
+            # Not stored in person/year order (e.g. a frame built outside load_frame): sort a copy once
+            df = sort_rows(df)
+            pid_codes, ids = pd.factorize(df['family_person'], sort=True)
+            years = df['year'].to_numpy()
+    offsets = np.searchsorted(pid_codes, np.arange(len(ids) + 1)).astype(np.int64)
+    return PersonIndex(frame=df, ids=np.asarray(ids), offsets=offsets, years=years)
+
+
+# --- Per-year statistics (Income Trends tabs) ---
+INCOME_COL = 'head_labor_income'
+
+
+def _sorted_blocks(keys, values):
+    # Sort once by (key, value) so every key is a contiguous block of sorted values
+    # -> (block keys, sorted values, block starts, block sizes)
+    order = np.argsort(values)
+    order = order[np.argsort(keys[order], kind='stable')]   # small-int keys: a radix sort
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    return keys[starts], values, starts, np.diff(np.r_[starts, len(values)])
+
+
+def _block_moments(keys, values):
+    # count/mean/median/std (ddof=1, like pandas) for all key blocks at once with reduceat
+    keys, values, starts, n = _sorted_blocks(keys, values)
+    if not len(starts):
+        empty = np.zeros(0)
+        return keys, empty, empty, empty
+    mean = np.add.reduceat(values, starts) / n
+    dev = values - np.repeat(mean, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(np.add.reduceat(dev * dev, starts) / (n - 1))
+    median = (values[starts + (n - 1) // 2] + values[starts + n // 2]) / 2
+    return keys, mean, median, std
+
+
+def block_quantiles(keys, values, quantiles):
+    # -> (block keys, (n_keys x n_quantiles) matrix): np.quantile's linear interpolation for every key
+    # block at once from one sort; values must be NaN-free
+    keys, values, starts, n = _sorted_blocks(keys, values)
+    pos = (n[:, None] - 1) * np.asarray(quantiles, dtype=np.float64)[None, :]
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    below, above = values[starts[:, None] + lo], values[starts[:, None] + hi]
+    return keys, below + (above - below) * (pos - lo)
+
+
+def year_statistics(df):
+    # One row per survey year: income mean/median/std and the same on log(income > 0) -- one grouped
+    # pass per series instead of groupby + per-year loops
+    years = df['year'].to_numpy()
+    out = pd.DataFrame({'year': np.unique(years)})
+    income = df[INCOME_COL].to_numpy(dtype=np.float64)
+    for prefix, ok in [('', ~np.isnan(income)), ('log_', income > 0)]:
+        vals = np.log(income[ok]) if prefix else income[ok]
+        keys, mean, median, std = _block_moments(years[ok], vals)
+        stats = pd.DataFrame({f'{prefix}mean': mean, f'{prefix}median': median, f'{prefix}std': std}, index=keys)
+        out = out.join(stats, on='year')
+    return out
+
+
+# --- Trajectory plotting (many people per chart) ---
+def nan_separated(lengths, *columns):
+    # Stack several people's series into ONE polyline per column with a gap (NaN / None) after each
+    # person, so a whole selection is a single Plotly trace instead of one trace per ID
+    lengths = np.asarray(lengths, dtype=np.int64)
+    slots = np.arange(int(lengths.sum())) + np.repeat(np.arange(len(lengths)), lengths)
+    out = []
+    for col in columns:
+        col = np.asarray(col)
+        text = col.dtype == object
+        line = np.full(len(slots) + len(lengths), None if text else np.nan, dtype=object if text else np.float64)
+        line[slots] = col
+        out.append(line)
+    return out
+
+
+# --- Re-bucketing incomes against alternative threshold schemes ---
+# A scheme is a per-year cutoff table (year + ascending cutoff columns) and one label per bucket; the
+# CSV's own quintile_label (clean.R's case_when against the Census thresholds) is the default.
+CSV_SCHEME = "Census quintiles (from the CSV)"
+# Within-sample rank schemes bucket the per-year percentile ranks instead (see percentile_ranks)
+RANK_SCHEMES = {"Within-sample rank quintiles": 5, "Within-sample rank deciles": 10}
+CUSTOM_RANK_SCHEME = "Within-sample rank bins"
+THRESHOLD_SCHEMES = [CSV_SCHEME, "Census quintiles + top 5%", "Sample quintiles (per-year cutoffs)",
+                     *RANK_SCHEMES, CUSTOM_RANK_SCHEME]
+
+
+def sample_cutoffs(df, n_buckets):
+    # Per-year cutoffs at the 1/n .. (n-1)/n quantiles of the sample's own incomes
+    years = df['year'].to_numpy()
+    income = df[INCOME_COL].to_numpy(dtype=np.float64)
+    ok = ~np.isnan(income)
+    keys, cutoffs = block_quantiles(years[ok], income[ok], np.arange(1, n_buckets) / n_buckets)
+    table = pd.DataFrame(cutoffs, columns=[f"q{i}" for i in range(1, n_buckets)])
+    table.insert(0, 'year', keys.astype(np.int64))
+    return table
+
+
+def threshold_scheme(name, df, thresholds):
+    # -> (cutoff table, bucket labels) for a named scheme other than CSV_SCHEME
+    if name == "Census quintiles + top 5%":
+        # "top" becomes the 80th-95th percentile band; the top 5% get their own bucket
+        return thresholds[['year'] + THRESHOLD_COLS], QUINTILE_OPTIONS + ["top 5%"]
+    if name == "Sample quintiles (per-year cutoffs)":
+        return sample_cutoffs(df, len(QUINTILE_OPTIONS)), list(QUINTILE_OPTIONS)
+    raise ValueError(f"Unknown threshold scheme: {name!r}")
+
+
+def rebucket(df, table, labels):
+    # Bucket of every row: 1 + number of its year's cutoffs strictly below the income, i.e. clean.R's
+    # `income <= Lowest ~ 1, income <= Second ~ 2, ...` chain. Rows are walked as sorted year blocks with
+    # one np.searchsorted per year; NaN incomes and years missing from the table stay unlabelled.
+    years = df['year'].to_numpy()
+    income = df[INCOME_COL].to_numpy(dtype=np.float64)
+    cutoffs = table.drop(columns='year').to_numpy(dtype=np.float64)
+    if cutoffs.shape[1] + 1 != len(labels):
+        raise ValueError(f"{cutoffs.shape[1]} cutoffs need {cutoffs.shape[1] + 1} labels, got {len(labels)}")
+    order = np.argsort(years, kind='stable')
+    sorted_years = years[order]
+    table_years = table['year'].to_numpy()
+    lo = np.searchsorted(sorted_years, table_years, side='left')
+    hi = np.searchsorted(sorted_years, table_years, side='right')
+    codes = np.full(len(df), -1, dtype=np.int8)
+    for cut, a, b in zip(cutoffs, lo, hi):
+        if a == b or np.isnan(cut).any():
+            continue
+        rows = order[a:b]
+        codes[rows] = np.searchsorted(cut, income[rows], side='left')
+    codes[np.isnan(income)] = -1
+    return pd.Categorical.from_codes(codes, categories=list(labels))
+
+
+# --- Within-sample percentile ranks ---
+def percentile_ranks(df):
+    # Per-year percentile rank of every row's income in (0, 1): (# lower + half the # tied) / n, i.e. the
+    # mid-rank of its value (ties share one rank, so equal incomes always land in the same bucket).
+    # One (year, income) sort for the whole panel; NaN incomes get NaN.
+    years = df['year'].to_numpy()
+    income = df[INCOME_COL].to_numpy(dtype=np.float64)
+    ranks = np.full(len(income), np.nan)
+    ok = np.flatnonzero(~np.isnan(income))
+    if not len(ok):
+        return ranks
+    order = np.argsort(income[ok])
+    order = ok[order[np.argsort(years[ok][order], kind='stable')]]
+    keys, values = years[order], income[order]
+    new_block = np.r_[True, keys[1:] != keys[:-1]]
+    new_run = new_block | np.r_[True, values[1:] != values[:-1]]
+    block_starts, run_starts = np.flatnonzero(new_block), np.flatnonzero(new_run)
+    block = np.cumsum(new_block) - 1
+    run = np.cumsum(new_run) - 1
+    block_size = np.diff(np.r_[block_starts, len(values)])[block]
+    run_size = np.diff(np.r_[run_starts, len(values)])[run]
+    ranks[order] = (run_starts[run] - block_starts[block] + run_size / 2) / block_size
+    return ranks
+
+
+def rank_bins(name):
+    # Number of rank buckets of a within-sample rank scheme name, None for threshold schemes
+    if name in RANK_SCHEMES:
+        return RANK_SCHEMES[name]
+    prefix = CUSTOM_RANK_SCHEME + " ("
+    if name.startswith(prefix) and name.endswith(")"):
+        return int(name[len(prefix):-1])
+    return None
+
+
+def custom_rank_scheme(n_bins):
+    return f"{CUSTOM_RANK_SCHEME} ({int(n_bins)})"
+
+
+def rank_labels(n_bins):
+    # Quintiles keep the dashboard's quintile names; other bin counts are named by percentile range
+    if n_bins == len(QUINTILE_OPTIONS):
+        return list(QUINTILE_OPTIONS)
+    edges = np.round(np.linspace(0, 100, n_bins + 1), 1)
+    return [f"p{lo:g}–{hi:g}" for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def rank_buckets(ranks, n_bins, labels):
+    # Equal-width buckets of the percentile ranks; NaN ranks stay unlabelled
+    codes = np.minimum(np.floor(np.nan_to_num(ranks, nan=0.0) * n_bins), n_bins - 1).astype(np.int8)
+    codes[np.isnan(ranks)] = -1
+    return pd.Categorical.from_codes(codes, categories=list(labels))
+
+
+def scheme_labels(data, scheme, thresholds, ranks=None):
+    # -> (frame with family_person/year/quintile_label, bucket labels) under a threshold scheme; the CSV's
+    # own labels (clean.R) for CSV_SCHEME. ranks (percentile_ranks(data)) is only read by the rank schemes
+    # and computed here when a caller doesn't pass its cached copy
+    if scheme == CSV_SCHEME:
+        return data, list(QUINTILE_OPTIONS)
+    n_bins = rank_bins(scheme)
+    if n_bins:
+        labels = rank_labels(n_bins)
+        ranks = percentile_ranks(data) if ranks is None else ranks
+        return data[['family_person', 'year']].assign(quintile_label=rank_buckets(ranks, n_bins, labels)), labels
+    table, labels = threshold_scheme(scheme, data, thresholds)
+    return data[['family_person', 'year']].assign(quintile_label=rebucket(data, table, labels)), labels
+
+
+# --- Columnar binary cache (one .npy file per column next to the CSV) ---
+# Each build goes into its own version directory inside cache_dir; the small CURRENT pointer file is
+# swapped with os.replace, so readers always resolve a complete version and a rebuild never deletes
+# files out from under a session that is still resolving the previous one.
+CURRENT = "CURRENT"
+
+
+def cache_dir(path, exclude_years=()):
+    # A frame with survey years dropped (e.g. layout.py's 1992) is its own cache, so it is memory-mapped
+    # and shared like the full one instead of being re-filtered into private memory
+    return os.path.splitext(path)[0] + "".join(f"_no{int(y)}" for y in sorted(exclude_years)) + "_cache"
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_hash(path):
+    # SHA-1 of the source CSV, taken from the cache metadata while its stamp is still current
+    meta = _read_meta(cache_dir(path))
+    if meta is not None and meta["source"] == _source_stamp(path):
+        return meta["sha1"]
+    return _file_hash(path)
+
+
+def _replace_file(dest, text):
+    # Atomic small-file write: temp file in the same directory, then os.replace
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(dest))
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp, dest)
+
+
+def version_tmpdir(cdir):
+    # Fresh in-progress build directory inside cdir (ignored by readers and pruning until published)
+    os.makedirs(cdir, exist_ok=True)
+    return tempfile.mkdtemp(prefix=".tmp_", dir=cdir)
+
+
+def current_version(cdir):
+    # Directory of the version CURRENT points at, or None when nothing was published yet
+    try:
+        with open(os.path.join(cdir, CURRENT)) as f:
+            return os.path.join(cdir, f.read().strip())
+    except OSError:
+        return None
+
+
+def publish_version(cdir, tmp):
+    # Rename a finished version_tmpdir build into place, point CURRENT at it, then prune older versions
+    # (open memmaps keep their files alive, and readers that lose a race retry -- see load_frame)
+    name = "v" + os.path.basename(tmp)[len(".tmp_"):]
+    os.replace(tmp, os.path.join(cdir, name))
+    _replace_file(os.path.join(cdir, CURRENT), name)
+    for entry in os.listdir(cdir):
+        # Other finished versions (and files of an old flat layout); in-progress .tmp_ builds are left alone
+        if entry in (name, CURRENT) or entry.startswith(".tmp_"):
+            continue
+        full = os.path.join(cdir, entry)
+        if os.path.isdir(full):
+            shutil.rmtree(full, ignore_errors=True)
+        else:
+            try:
+                os.remove(full)
+            except OSError:
+                pass
+
+
+def _read_meta(cdir):
+    # Metadata of the current cache version (with "dir" = its directory), or None
+    vdir = current_version(cdir)
+    if vdir is None:
+        return None
+    try:
+        with open(os.path.join(vdir, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    meta["dir"] = vdir
+    return meta
+
+
+def _write_meta(meta):
+    _replace_file(os.path.join(meta["dir"], "meta.json"), json.dumps({k: v for k, v in meta.items() if k != "dir"}))
+
+
+def write_cache(df, cdir, source, sha1, thresholds):
+    # Build a new version directory, then publish it (see publish_version)
+    tmp = version_tmpdir(cdir)
+    np.save(os.path.join(tmp, "thresholds.npy"), thresholds.to_numpy(dtype=np.float64))
+    columns = []
+    for i, col in enumerate(df.columns):
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(tmp, f"{i}.npy"), s.cat.codes.to_numpy())
+            np.save(os.path.join(tmp, f"{i}.cats.npy"), s.cat.categories.to_numpy().astype(str))
+            columns.append({"name": col, "kind": "category"})
+        else:
+            np.save(os.path.join(tmp, f"{i}.npy"), s.to_numpy())
+            columns.append({"name": col, "kind": "plain"})
+    _write_meta({"dir": tmp, "version": CACHE_VERSION, "source": source, "sha1": sha1,
+                 "n_rows": len(df), "columns": columns, "thresholds": list(thresholds.columns)})
+    publish_version(cdir, tmp)
+
+
+def read_cache(meta, mmap=False):
+    # mmap=True attaches every column as a read-only np.memmap: the OS page cache is shared by all
+    # sessions and server processes, and the frame is built on top of it without copying
+    mode = 'r' if mmap else None
+    vdir = meta["dir"]
+    data = {}
+    for i, c in enumerate(meta["columns"]):
+        values = np.load(os.path.join(vdir, f"{i}.npy"), mmap_mode=mode)
+        if c["kind"] == "category":
+            cats = np.load(os.path.join(vdir, f"{i}.cats.npy"))
+            values = pd.Categorical.from_codes(values, categories=cats.astype(object))
+        data[c["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def read_thresholds(meta):
+    table = pd.DataFrame(np.load(os.path.join(meta["dir"], "thresholds.npy")), columns=meta["thresholds"])
+    return table.astype({'year': np.int64})
+
+
+CACHE_RETRIES = 3
+
+
+def load_frame(path, mmap=False, exclude_years=()):
+    # Read dream_92.csv through the binary cache; rebuilt when the source's mtime/size AND hash change.
+    # Rows come back sorted by family_person then year (see person_index), without the per-year
+    # threshold columns (see load_thresholds) and without the rows of exclude_years.
+    cdir = cache_dir(path, exclude_years)
+    source = _source_stamp(path)
+    sha1 = None
+    for _ in range(CACHE_RETRIES):
+        meta = _read_meta(cdir)
+        if meta is None:
+            break
+        if meta["source"] != source:
+            sha1 = sha1 or _file_hash(path)
+            if meta["sha1"] != sha1:
+                break
+            # Touched but unchanged: refresh the stamp and keep the cache
+            meta["source"] = source
+            try:
+                _write_meta(meta)
+            except OSError:
+                pass
+        try:
+            return read_cache(meta, mmap)
+        except FileNotFoundError:
+            # Another session swapped in a rebuild and pruned this version meanwhile: resolve CURRENT again
+            continue
+    df, thresholds = split_thresholds(pd.read_csv(path))
+    if exclude_years:
+        df = df[~df['year'].isin(exclude_years)]
+        thresholds = thresholds[~thresholds['year'].isin(exclude_years)]
+    df = sort_rows(optimize_dtypes(df))
+    try:
+        write_cache(df, cdir, source, sha1 or _file_hash(path), thresholds)
+    except OSError:
+        # Read-only checkout: still serve the optimized frame, just without a cache
+        return df
+    if mmap:
+        meta = _read_meta(cdir)
+        try:
+            return read_cache(meta, mmap) if meta is not None else df
+        except FileNotFoundError:
+            return df
+    return df
+
+
+def load_thresholds(path, exclude_years=()):
+    # Per-year threshold table (year + THRESHOLD_COLS present in the CSV), split off at load time
+    cdir = cache_dir(path, exclude_years)
+    for _ in range(CACHE_RETRIES):
+        meta = _read_meta(cdir)
+        if meta is None or meta["source"] != _source_stamp(path):
+            load_frame(path, exclude_years=exclude_years)
+            meta = _read_meta(cdir)
+        if meta is None:
+            break
+        try:
+            return read_thresholds(meta)
+        except FileNotFoundError:
+            continue
+    # Read-only checkout without a cache: only read the columns the table needs
+    raw = pd.read_csv(path, usecols=lambda col: col == 'year' or col in THRESHOLD_COLS)
+    thresholds = split_thresholds(raw)[1]
+    return thresholds[~thresholds['year'].isin(exclude_years)].reset_index(drop=True)
+
+
+def open_frame(path, exclude_years=()):
+    # Shared read-only dataset: memory-mapped columns, callers must never write into the frame
+    return load_frame(path, mmap=True, exclude_years=exclude_years)
@@ -1,42 +1,125 @@
+import os
 import pandas as pd
 import numpy as np
 import streamlit as st
 import matplotlib.pyplot as plt
 import plotly.express as px
 import plotly.graph_objects as go
+import cube
+import dataset
+import kernels
+import mobility
+import trajectories
+import transitions
 
 # --- Streamlit Page Setup ---
 st.set_page_config(layout="wide", page_title="Dream: An Economic Mobility Dashboard")
 
-@st.cache_data
+@st.cache_resource(show_spinner="Attaching dataset...")
 def load_data(path):
-    return pd.read_csv(path)
+    # ONE read-only, memory-mapped frame per server process (st.cache_data would pickle/copy it on every
+    # rerun); the mapped columns are shared through the OS page cache by all sessions and processes.
+    # Never write into df -- derive new frames instead.
+    return dataset.open_frame(path)
 
 DATA_PATH = "dream_92.csv"
 
 df = load_data(DATA_PATH)
 
+@st.cache_resource(show_spinner="Loading quintile thresholds...")
+def load_threshold_table(path):
+    # Census quintile thresholds, one row per year, split off the person-year rows at load time
+    return dataset.load_thresholds(path)
+
+thresholds = load_threshold_table(DATA_PATH)
+
+@st.cache_resource(show_spinner="Ranking incomes within each year...")
+def load_ranks(path):
+    # Per-year within-sample percentile rank of every row, computed once per data file and shared by
+    # every rank scheme (quintiles, deciles, custom bins)
+    return dataset.percentile_ranks(load_data(path))
+
+@st.cache_resource(show_spinner="Re-bucketing incomes...")
+def load_scheme_labels(path, scheme):
+    # dataset.scheme_labels, once per data file and scheme
+    ranks = load_ranks(path) if dataset.rank_bins(scheme) else None
+    return dataset.scheme_labels(load_data(path), scheme, load_threshold_table(path), ranks)
+
+@st.cache_resource(show_spinner="Encoding quintile panel...")
+def load_panel(path, scheme=dataset.CSV_SCHEME):
+    # int8 (person x year) quintile matrix + presence bitmasks, built once per data file and scheme and
+    # shared by every mobility calculator below instead of re-filtering/sorting df
+    labelled, labels = load_scheme_labels(path, scheme)
+    return mobility.build_panel(labelled, labels)
+
 # --- Sidebar Inputs ---
 st.sidebar.header("Mobility Calculator Options")
 years = sorted(df['year'].unique())
 years_with_all = ['All years'] + years
-quintile_options = ["lowest", "second", "third", "fourth", "top"]
 comp_options = ["Exact", "No higher than", "No lower than"]
+threshold_scheme = st.sidebar.selectbox("Quintile thresholds:", dataset.THRESHOLD_SCHEMES, index=0,
+                                        help="Re-bucket head_labor_income against other per-year cutoffs; "
+                                             "every calculator below uses the selected buckets.")
+if threshold_scheme == dataset.CUSTOM_RANK_SCHEME:
+    n_rank_bins = st.sidebar.number_input("Number of rank bins:", min_value=2, max_value=20, value=4,
+                                          help="Equal-width bins of the per-year percentile rank.")
+    threshold_scheme = dataset.custom_rank_scheme(n_rank_bins)
+panel = load_panel(DATA_PATH, threshold_scheme)
+quintile_options = list(panel.quintile_options)
+# Bucket-number axis labels built from the active scheme's labels (5 quintiles, 10 deciles, ...)
+quintile_axis_option, quintile_axis_title = trajectories.quintile_axis(quintile_options)
 
 start_year = st.sidebar.selectbox("Select A Start Year (childhood):", years_with_all, index=0)
 start_quintile_comp = st.sidebar.selectbox("Start Quintile Comparison:", comp_options, index=0)
 start_quintile = st.sidebar.selectbox("Select A Start Quintile (childhood):", quintile_options, index=0)
-time_horizon = st.sidebar.number_input("Time horizon (years):", min_value=1, max_value=40, value=10)
-consec_years = st.sidebar.number_input("Robustness Window: Consecutive years in goal quintile (robust mobility):", min_value=1, max_value=15, value=3)
+time_horizon = st.sidebar.number_input("Time horizon (years):", min_value=1, max_value=mobility.MAX_HORIZON, value=10)
+consec_years = st.sidebar.number_input("Robustness Window: Consecutive years in goal quintile (robust mobility):", min_value=1, max_value=mobility.MAX_WINDOW, value=3)
 goal_quintile_comp = st.sidebar.selectbox("GOAL Quintile Comparison:", comp_options, index=0)
-goal_quintile = st.sidebar.selectbox("Select A GOAL Quintile:", quintile_options, index=4)
-
-# --- Helper Functions ---
-def quintile_num(q):
-    try:
-        return quintile_options.index(q) + 1
-    except Exception:
-        return np.nan
+goal_quintile = st.sidebar.selectbox("Select A GOAL Quintile:", quintile_options,
+                                     index=len(quintile_options) - 1)
+
+# Per-person loop engines are for debugging / checking the vectorized engine; "parallel" shards people
+# across worker processes. The compiled kernel needs numba and otherwise falls back to the vectorized engine;
+# "Run-length spans" checks each start year by binary search in the per-goal-range run-length index.
+engine_backends = {"Vectorized": "numpy", "Compiled kernel (numba)": "numba", "Run-length spans": "runs"}
+engine_options = list(engine_backends) + ["Reference loop (debug)", "Reference loop, parallel"]
+with st.sidebar.expander("Engine (advanced)", expanded=False):
+    engine = st.selectbox("Mobility engine:", engine_options, index=0)
+    if engine == "Compiled kernel (numba)" and not kernels.HAVE_NUMBA:
+        st.caption("numba is not installed -- using the vectorized engine.")
+    cpu_count = os.cpu_count() or 1
+    n_workers = st.number_input("Parallel workers:", min_value=1, max_value=cpu_count, value=cpu_count,
+                                disabled=(engine != "Reference loop, parallel"))
+workers = n_workers if engine == "Reference loop, parallel" else 1
+with st.sidebar.expander("Uncertainty", expanded=False):
+    show_ci = st.checkbox("Bootstrap confidence intervals", value=True,
+                          help=f"Percentile bootstrap over people ({mobility.BOOTSTRAP_RESAMPLES:,} resamples) "
+                               "from the counts of one engine pass.")
+    ci_level = st.select_slider("Confidence level:", options=mobility.CI_LEVELS, value=0.95,
+                                format_func=lambda level: f"{level:.0%}", disabled=not show_ci)
+
+def interval_text(n_achievers, n_total):
+    # mobility.interval_text at the sidebar's level, "" when intervals are off
+    return mobility.interval_text(n_achievers, n_total, ci_level) if show_ci else ""
+
+@st.cache_resource(show_spinner="Indexing trajectories...")
+def load_person_index(path):
+    # family_person -> contiguous block of the person/year-sorted df, so a trajectory is a slice
+    return dataset.person_index(load_data(path))
+
+people = load_person_index(DATA_PATH)
+
+@st.cache_resource(show_spinner="Summarizing income by year...")
+def load_year_stats(path):
+    # Income mean, median and std (linear + log) for every year, once per data file; the per-year
+    # thresholds come from load_threshold_table
+    return dataset.year_statistics(load_data(path))
+
+year_stats = load_year_stats(DATA_PATH)
+
+def quintile_num(frame):
+    # Bucket number (1..K) of each row under the selected threshold scheme, NaN when unlabelled
+    return trajectories.quintile_num(panel, frame)
 
 def get_quintile_range(q, comp, q_opts):
     idx = q_opts.index(q)
@@ -49,7 +132,8 @@ def get_quintile_range(q, comp, q_opts):
     else:
         return [q]
 
-@st.cache_data(show_spinner="Finding robust achievers (revised logic)...")
+# cache_resource: results hold PersonSet bitmaps tied to the shared panel -- don't pickle/copy them per rerun
+@st.cache_resource(show_spinner="Finding robust achievers (revised logic)...", max_entries=256)
 # def robust_achievers_corrected(df, start_quintile_range, goal_quintile_range, time_horizon, consec_years, quintile_options, restrict_start_year=None):
 #     df = df[df['quintile_label'].isin(quintile_options)].copy()
 #     df = df.sort_values(["family_person", "year"])
@@ -81,49 +165,84 @@ def get_quintile_range(q, comp, q_opts):
 #     n_total = len(valid_denominator)
 #     return list(robust_set), n_achievers, n_total
 
-def robust_achievers_corrected(df, start_quintile_range, goal_quintile_range, time_horizon, consec_years, quintile_options,restrict_start_year=None):
-    df = df[df['quintile_label'].isin(quintile_options)].copy()
-    df = df.sort_values(["family_person", "year"])
-    robust_set = set()
-    valid_denominator = set()
-    for pid, group in df.groupby("family_person"):
-        years = group['year'].values
-        quintiles = group['quintile_label'].values
-        start_years = years[np.isin(quintiles, start_quintile_range)]
-        # Only allow start_years to be the restrict_start_year if set:
-        if restrict_start_year is not None:
-            start_years = [y for y in start_years if y == restrict_start_year]
-        if len(start_years) == 0:
-            continue
-        for start_year in start_years:
-            end_year = start_year + time_horizon + consec_years - 1
-            if years[-1] < end_year:
-                continue
-            valid_denominator.add(pid)
-            target_years = np.arange(start_year + time_horizon, start_year + time_horizon + consec_years)
-            if not np.all(np.isin(target_years, years)):
-                continue
-            mask = np.isin(years, target_years)
-            if np.all([q in goal_quintile_range for q in quintiles[mask]]):
-                robust_set.add(pid)
-                break
-    n_achievers = len(robust_set)
-    n_total = len(valid_denominator)
-    return list(robust_set), n_achievers, n_total
-
-def ever_reached_goal(df, start_range, goal_range):
-    reached = 0
-    total = 0
-    reached_ids = []
-    df_filtered = df[df['quintile_label'].isin(quintile_options)]
-    for pid, group in df_filtered.groupby("family_person"):
-        quintiles = group.sort_values("year")['quintile_label'].values
-        if any(q in start_range for q in quintiles):
-            total += 1
-            if any(q in goal_range for q in quintiles):
-                reached += 1
-                reached_ids.append(pid)
-    return reached, total, reached_ids
+def robust_achievers_corrected(_panel, start_quintile_range, goal_quintile_range, time_horizon, consec_years,
+                               restrict_start_year=None, year_range=None, engine="Vectorized", workers=1,
+                               scheme=dataset.CSV_SCHEME):
+    # Vectorized over the (person x year) quintile panel -- same ids/counts as the old per-person loop
+    # (kept as mobility.robust_achievers_reference). Periods are column slices via year_range.
+    # `scheme` names the threshold scheme _panel was built with (part of the cache key).
+    if engine in engine_backends:
+        return mobility.robust_achievers(_panel, start_quintile_range, goal_quintile_range, time_horizon,
+                                         consec_years, restrict_start_year=restrict_start_year, year_range=year_range,
+                                         backend=engine_backends[engine])
+    data, labels = load_scheme_labels(DATA_PATH, scheme)
+    if year_range is not None:
+        data = data[data['year'].between(*year_range)]
+    achiever_ids, n_achievers, n_total = mobility.run_sharded(
+        "robust", data, start_quintile_range, goal_quintile_range, time_horizon, consec_years,
+        quintile_options=labels, restrict_start_year=restrict_start_year, workers=workers)
+    # The loops don't record windows (None: the plot asks the vectorized engine)
+    return achiever_ids, n_achievers, n_total, None
+
+@st.cache_resource(show_spinner="Attaching mobility cube...")
+def load_cube(path, stamp):
+    # Built offline with `python cube.py dream_92.csv`; None when missing or built from other data.
+    # stamp (cube.cube_stamp) is only the cache key, so a rebuilt cube is picked up without a restart.
+    return cube.open_cube(path, load_panel(path))
+
+mobility_cube = load_cube(DATA_PATH, cube.cube_stamp(DATA_PATH))
+
+def mobility_query(start_quintile_range, goal_quintile_range, time_horizon, consec_years, restrict_start_year=None):
+    # O(1) answer from the precomputed cube (CSV labels, "All years" only), live engine when the cube is
+    # stale/missing, a debug engine is on or another threshold scheme is selected. A single start year goes
+    # straight to the engine's cohort pushdown, which only reads that year's cohort.
+    # -> (achiever_ids, n_achievers, n_total, windows); windows is None when the engine didn't record them
+    hit = None
+    if engine == "Vectorized" and threshold_scheme == dataset.CSV_SCHEME and restrict_start_year is None:
+        hit = cube.lookup(mobility_cube, panel, start_quintile_range, goal_quintile_range, time_horizon,
+                          consec_years)
+    if hit is None:
+        return robust_achievers_corrected(panel, start_quintile_range, goal_quintile_range, time_horizon, consec_years,
+                                          restrict_start_year=restrict_start_year, engine=engine, workers=workers,
+                                          scheme=threshold_scheme)
+    achiever_ids, n_achievers, n_total = hit
+    return achiever_ids, n_achievers, n_total, None
+
+@st.cache_resource(show_spinner="Sweeping horizons and robustness windows...", max_entries=64)
+def mobility_surface(_panel, start_quintile_range, goal_quintile_range, restrict_start_year=None,
+                     scheme=dataset.CSV_SCHEME):
+    # (n_achievers, n_total) for every sidebar time horizon x robustness window in one panel pass
+    return mobility.robust_surface(_panel, start_quintile_range, goal_quintile_range, mobility.MAX_HORIZON,
+                                   mobility.MAX_WINDOW, restrict_start_year)
+
+def robust_goal_periods(panel, start_range, goal_range, time_horizon, consec_years, periods):
+    # -> [(achievers, total, achiever_ids)] per (first year, last year) period; the panel engines do every
+    # period in one pass, the loop engines one sliced run per period
+    if engine in engine_backends:
+        return mobility.robust_periods(panel, start_range, goal_range, time_horizon, consec_years, periods)
+    results = [robust_achievers_corrected(panel, start_range, goal_range, time_horizon, consec_years,
+                                          year_range=period, engine=engine, workers=workers, scheme=threshold_scheme)
+               for period in periods]
+    return [(n_achievers, n_total, ids) for ids, n_achievers, n_total, _ in results]
+
+def parse_periods(text):
+    # "1968-1980, 1981-1995" -> [(1968, 1980), (1981, 1995)]; malformed entries are skipped
+    periods = []
+    for part in text.replace(";", ",").split(","):
+        bounds = part.replace("–", "-").split("-")
+        if len(bounds) == 2 and all(b.strip().isdigit() for b in bounds):
+            lo, hi = sorted(int(b) for b in bounds)
+            periods.append((lo, hi))
+    return periods
+
+def ever_reached_goal(panel, start_range, goal_range, periods):
+    # -> [(reached, total, reached_ids)] per (first year, last year) period, computed together
+    if engine in engine_backends:
+        return mobility.ever_reached_periods(panel, start_range, goal_range, periods)
+    data, labels = load_scheme_labels(DATA_PATH, threshold_scheme)
+    return [mobility.run_sharded("ever", data[data['year'].between(*period)], start_range, goal_range,
+                                 quintile_options=labels, workers=workers)
+            for period in periods]
 
 # --- Shared Color Mapping ---
 quintile_colors = {
@@ -131,7 +250,8 @@ quintile_colors = {
     'fourth': '#1f77b4',
     'third': '#2ca02c',
     'second': '#ff7f0e',
-    'lowest': '#d62728'
+    'lowest': '#d62728',
+    'top 5%': '#8c564b'
 }
 
 tab_titles = [
@@ -161,19 +281,13 @@ with tabs[0]:
         st.stop()
 
     if start_year == "All years":
-        achiever_ids, n_achievers, n_total = robust_achievers_corrected(
-            df, start_quintile_range, goal_quintile_range, time_horizon, consec_years, quintile_options)
+        achiever_ids, n_achievers, n_total, achiever_windows = mobility_query(
+            start_quintile_range, goal_quintile_range, time_horizon, consec_years)
     else:
         sy = int(start_year)
-        # Identify those who are in the start quintile in the specific start year
-        eligible_ids = df[(df['year'] == sy) & (df['quintile_label'].isin(start_quintile_range))][
-            'family_person'].unique()
-        # Only pass all years for those people to the function!
-        df_cohort = df[df['family_person'].isin(eligible_ids)].copy()
-        # But, inside robust_achievers_corrected, restrict valid start windows to ONLY the specific year
-        achiever_ids, n_achievers, n_total = robust_achievers_corrected(
-            df_cohort, start_quintile_range, goal_quintile_range, time_horizon, consec_years, quintile_options,
-            restrict_start_year=sy)
+        # Restrict valid start windows to ONLY the specific year
+        achiever_ids, n_achievers, n_total, achiever_windows = mobility_query(
+            start_quintile_range, goal_quintile_range, time_horizon, consec_years, restrict_start_year=sy)
 
     if n_total == 0:
         st.warning("No valid cases found for these criteria.")
@@ -183,79 +297,99 @@ with tabs[0]:
             f"IDs of individuals who meet criteria ({n_achievers}): {', '.join(str(x) for x in achiever_ids[:30])}" +
             ("..." if n_achievers > 30 else ""))
         st.success(f"Probability: {probability:.1%} ({n_achievers} out of {n_total} people)")
+        if show_ci:
+            st.caption(f"Bootstrap over the {n_total:,} people in the denominator. "
+                       f"{interval_text(n_achievers, n_total)}")
+
+    if st.toggle("Sweep every time horizon × robustness window", value=False, key="sweep_mode",
+                 help="The whole probability surface for the current start/goal selection from one pass "
+                      "(always the vectorized engine)."):
+        sweep_achievers, sweep_total = mobility_surface(
+            panel, start_quintile_range, goal_quintile_range,
+            None if start_year == "All years" else int(start_year), scheme=threshold_scheme)
+        sweep_prob = np.where(sweep_total > 0, sweep_achievers / np.maximum(sweep_total, 1) * 100, np.nan)
+        horizons = np.arange(1, mobility.MAX_HORIZON + 1)
+        windows = np.arange(1, mobility.MAX_WINDOW + 1)
+        sweep_view = st.radio("Show sweep as:", ["Heatmap", "Curves"], index=0, horizontal=True, key="sweep_view")
+        if sweep_view == "Heatmap":
+            fig = go.Figure(go.Heatmap(
+                z=sweep_prob, x=windows, y=horizons, colorscale="Viridis", colorbar=dict(title="%"),
+                customdata=np.dstack([sweep_achievers, sweep_total]),
+                hovertemplate="Horizon %{y}, window %{x}: %{z:.2f}%<br>%{customdata[0]} of %{customdata[1]}"
+                              "<extra></extra>"))
+            fig.add_trace(go.Scatter(x=[consec_years], y=[time_horizon], mode="markers", name="Current selection",
+                                     marker=dict(symbol="x", size=12, color="red")))
+            fig.update_layout(title="Probability (%) by Time Horizon and Robustness Window",
+                              xaxis_title="Robustness window (consecutive years)", yaxis_title="Time horizon (years)",
+                              template="plotly_white", height=550)
+        else:
+            curve_windows = st.multiselect("Robustness windows to draw:", list(windows),
+                                           default=sorted({1, 3, 5, 10, int(consec_years)}), key="sweep_windows")
+            curves = pd.DataFrame({
+                "Time horizon (years)": np.tile(horizons, len(curve_windows)),
+                "Probability (%)": np.concatenate([sweep_prob[:, c - 1] for c in curve_windows])
+                if curve_windows else np.zeros(0),
+                "Window": np.repeat([f"{c} yr" for c in curve_windows], len(horizons))
+            })
+            fig = px.line(curves, x="Time horizon (years)", y="Probability (%)", color="Window", markers=True,
+                          title="Probability Decay over Time Horizon, by Robustness Window", template="plotly_white")
+        st.plotly_chart(fig, use_container_width=True)
 
     if n_achievers > 0:
         st.subheader("Individual Mobility Trajectory")
-        plot_id = st.selectbox("Select an individual ID to plot trajectory:", achiever_ids, index=0)
+        # Only the page of IDs shown in the picker is materialized from the achiever bitmap
+        page_size = 500
+        page_start = 0
+        if n_achievers > page_size:
+            page_start = st.number_input(f"Browse achievers ({page_size} per page), starting at #:", min_value=1,
+                                         max_value=n_achievers, value=1, step=page_size) - 1
+        plot_id = st.selectbox("Select an individual ID to plot trajectory:",
+                               achiever_ids[page_start:page_start + page_size], index=0)
         col1, col2 = st.columns([4, 1])
         with col2:
-            plot_yaxis = st.radio("Plot y-axis:", ["Quintile (1–5)", "head_labor_income"], index=0,
+            plot_yaxis = st.radio("Plot y-axis:", [quintile_axis_option, "head_labor_income"], index=0,
                                   key="plot_yaxis_side")
 
-        # Use the correct data source for this individual!
-        if start_year == "All years":
-            # Find this individual's full trajectory from the full df
-            person_data = df[(df['family_person'] == plot_id) & (df['head_labor_income'] > 0)].copy()
-        else:
-            # Only consider cohort for this start_year and restrict years >= start_year (optional)
-            person_data = df_cohort[
-                (df_cohort['family_person'] == plot_id) & (df_cohort['head_labor_income'] > 0)
-                ].copy()
+        # This individual's rows (already sorted by year) straight from the person index
+        person_data = people.rows(plot_id)
+        person_data = person_data[person_data['head_labor_income'] > 0].copy()
+        if start_year != "All years":
+            # Only years from the chosen start year on
             person_data = person_data[person_data['year'] >= int(start_year)]
 
         if person_data.empty:
             st.warning("No income records for this person.")
         else:
-            person_data = person_data.sort_values("year")
-            person_data['quintile_num'] = person_data['quintile_label'].map(quintile_num)
-            yvar = 'quintile_num' if plot_yaxis == "Quintile (1–5)" else 'head_labor_income'
-            ytitle = "Income Quintile (1=Lowest, 5=Top)" if yvar == "quintile_num" else "Head Labor Income ($)"
+            person_data['quintile_num'] = quintile_num(person_data)
+            yvar = 'quintile_num' if plot_yaxis == quintile_axis_option else 'head_labor_income'
+            ytitle = quintile_axis_title if yvar == "quintile_num" else "Head Labor Income ($)"
             fig = px.line(person_data, x="year", y=yvar, title=f"Trajectory for ID {plot_id}", markers=True)
             if yvar == "quintile_num":
                 fig.update_yaxes(title=ytitle, tickmode='linear', dtick=1)
             else:
                 fig.update_yaxes(title=ytitle, tickformat=",", rangemode="tozero", showgrid=True)
 
-            # ------- NEW LOGIC FOR WINDOW HIGHLIGHTING --------
-            # This person only qualifies as an achiever by meeting robust mobility at least once
+            # ------- WINDOW HIGHLIGHTING --------
+            # The windows come from the same engine pass that counted this person as an achiever
+            # (cube / debug-loop results don't carry them, so those look this one person up in the
+            # run-length goal-span index instead of re-running an engine).
             # We'll plot/highlight ONLY the first window (for visual clarity)
-            years_arr = person_data["year"].values
-            quintiles_arr = person_data["quintile_label"].values
-
-            found = False
-            if start_year == "All years":
-                # All valid start years for this person
-                start_years = person_data[person_data["quintile_label"].isin(start_quintile_range)]["year"].values
+            if achiever_windows is None:
+                windows = mobility.person_windows(
+                    panel, plot_id, start_quintile_range, goal_quintile_range, time_horizon, consec_years,
+                    restrict_start_year=None if start_year == "All years" else int(start_year))
             else:
-                sy = int(start_year)
-                if sy in person_data[person_data["quintile_label"].isin(start_quintile_range)]["year"].values:
-                    start_years = np.array([sy])
-                else:
-                    start_years = np.array([])
-
-            for sy in start_years:
-                # Get the N *actual* next available survey years, not just calendar years!
-                possible_goal_years = years_arr[years_arr > sy + time_horizon - 1]  # survey years after horizon
-                # You need to get the first N years after the time horizon
-                window_start_idx = np.where(years_arr == sy + time_horizon)[0]
-                if len(window_start_idx) == 0:
-                    continue
-                idx = window_start_idx[0]
-                goal_years = years_arr[idx:idx + consec_years]
-                if len(goal_years) < consec_years:
-                    continue
-                # Check if all those years are present and in goal range
-                mask = np.isin(years_arr, goal_years)
-                if np.all([q in goal_quintile_range for q in quintiles_arr[mask]]):
-                    fig.add_vline(x=sy, line_dash="dash", line_color="green", annotation_text="Start",
-                                  annotation_position="top left")
-                    fig.add_vline(x=goal_years[0], line_dash="dash", line_color="orange",
-                                  annotation_text="Time Horizon", annotation_position="top right")
-                    goal_vals = person_data[person_data['year'].isin(goal_years)][yvar]
-                    fig.add_scatter(x=goal_years, y=goal_vals, mode="markers",
-                                    marker=dict(symbol='x', color="red", size=14), name="Goal Years")
-                    found = True
-                    break  # Only show the first window they succeeded in
+                windows = achiever_windows.of(plot_id)
+            found = bool(windows)
+            if found:
+                sy, first_goal_year, last_goal_year = windows[0]
+                fig.add_vline(x=sy, line_dash="dash", line_color="green", annotation_text="Start",
+                              annotation_position="top left")
+                fig.add_vline(x=first_goal_year, line_dash="dash", line_color="orange",
+                              annotation_text="Time Horizon", annotation_position="top right")
+                goal_rows = person_data[person_data['year'].between(first_goal_year, last_goal_year)]
+                fig.add_scatter(x=goal_rows['year'], y=goal_rows[yvar], mode="markers",
+                                marker=dict(symbol='x', color="red", size=14), name="Goal Years")
 
             if not found:
                 st.info(
@@ -276,9 +410,9 @@ with tabs[0]:
 # ========== TAB 1: Matrix Check ========== #
 with tabs[1]:
     st.header("Mobility Matrix Check")
-    quintile_order = ['lowest', 'second', 'third', 'fourth', 'top']
-    df['quintile_label'] = pd.Categorical(df['quintile_label'], categories=quintile_order, ordered=True)
-    transition_counts = df.groupby(['year', 'quintile_label'])['family_person'].nunique().reset_index()
+    quintile_order = quintile_options
+    # Per-year quintile counts, computed once per dataset from the shared panel's integer codes
+    transition_counts = mobility.quintile_count_frame(panel)
     fig_matrix = px.bar(
         transition_counts,
         x='year',
@@ -292,6 +426,9 @@ with tabs[1]:
     )
     st.plotly_chart(fig_matrix, use_container_width=True)
 
+    # Transition matrices between consecutive survey years and after a time horizon
+    transitions.transition_heatmaps(panel, start_year, time_horizon)
+
     # === Animated Income Distribution & Static Side-by-Side === #
     st.subheader("Income Quintile Distribution: 1968, 1993, 2022")
     percents = {
@@ -397,11 +534,11 @@ with tabs[1]:
 with tabs[2]:
     st.header("Income Quintile Thresholds Over Time")
     quintile_cols = ['Lowest', 'Second', 'Third', 'Fourth', 'Lower.limit.of.top.5.percent..dollars.']
-    existing_cols = [col for col in quintile_cols if col in df.columns]
+    existing_cols = [col for col in quintile_cols if col in thresholds.columns]
     if not existing_cols:
         st.error("None of the expected quintile columns were found in the dataset.")
     else:
-        quintiles_by_year = df.groupby('year')[existing_cols].mean().reset_index()
+        quintiles_by_year = thresholds[['year'] + existing_cols]
         melted = quintiles_by_year.melt(id_vars='year', var_name='Quintile', value_name='Threshold')
         label_map = {
             'Lowest': '1st Quintile (Lowest)',
@@ -445,7 +582,8 @@ with tabs[2]:
 # ========== TAB 3: Income Trends (Mean, Median, Std Dev, with log plot) ========== #
 with tabs[3]:
     st.header("Income Trends: Mean, Median, & Std Dev (Linear & Log Scales)")
-    income_stats = df.groupby('year')['head_labor_income'].agg(['mean', 'median', 'std']).reset_index()
+    # Precomputed once per dataset (dataset.year_statistics)
+    income_stats = year_stats[['year', 'mean', 'median', 'std']]
     # Linear plot as before...
     fig_income = go.Figure([
         go.Scatter(x=income_stats.year, y=income_stats['mean'], name='Mean', line_color='blue'),
@@ -460,17 +598,7 @@ with tabs[3]:
     st.plotly_chart(fig_income, use_container_width=True)
 
     # Log plot with correct std dev in log space
-    yearly = []
-    for year, group in df.groupby('year'):
-        incomes = group['head_labor_income']
-        log_incomes = np.log(incomes[incomes > 0])
-        yearly.append({
-            'year': year,
-            'log_mean': log_incomes.mean(),
-            'log_median': np.median(log_incomes),
-            'log_std': log_incomes.std()
-        })
-    income_stats_log = pd.DataFrame(yearly).sort_values('year')
+    income_stats_log = year_stats[['year', 'log_mean', 'log_median', 'log_std']]
 
     fig_income_log = go.Figure([
         go.Scatter(x=income_stats_log.year, y=income_stats_log['log_mean'], name='Log(Mean)', line_color='blue'),
@@ -486,7 +614,7 @@ with tabs[3]:
 
 # ========== TAB 4: Ever Reached Comparison (Early vs Later) ========== #
 with tabs[4]:
-    st.header("Ever Reached Goal: Early vs. Later Periods (1968–1995 vs 1996–2022)")
+    st.header("Ever Reached Goal: Comparing Periods")
     ever_calc_mode = st.selectbox(
         "Calculation Method:",
         [
@@ -496,49 +624,69 @@ with tabs[4]:
     )
     start_range = get_quintile_range(start_quintile, start_quintile_comp, quintile_options)
     goal_range = get_quintile_range(goal_quintile, goal_quintile_comp, quintile_options)
-    early_period = (1968, 1995)
-    late_period = (1996, 2022)
+    period_mode = st.radio("Periods:", ["Early vs. later (1968–1995 vs 1996–2022)", "Custom windows",
+                                        "Rolling windows"], index=0, horizontal=True, key="period_mode")
+    if period_mode == "Custom windows":
+        periods = parse_periods(st.text_input("Year windows (first-last, comma separated):",
+                                              value="1968-1980, 1981-1995, 1996-2009, 2010-2022"))
+    elif period_mode == "Rolling windows":
+        year_span = int(years[-1]) - int(years[0]) + 1
+        col_len, col_stride = st.columns(2)
+        with col_len:
+            window_length = st.number_input("Window length (years):", min_value=2, max_value=year_span, value=10)
+        with col_stride:
+            window_stride = st.number_input("Stride (years):", min_value=1, max_value=year_span, value=5)
+        periods = mobility.rolling_periods(years[0], years[-1], window_length, window_stride)
+    else:
+        periods = [(1968, 1995), (1996, 2022)]
+    period_labels = [f"{lo}–{hi}" for lo, hi in periods]
+
     if ever_calc_mode == "Ever Reached (Plain)":
-        reached_early, total_early, _ = ever_reached_goal(df[df['year'].between(*early_period)], start_range, goal_range)
-        reached_late, total_late, _ = ever_reached_goal(df[df['year'].between(*late_period)], start_range, goal_range)
+        period_results = ever_reached_goal(panel, start_range, goal_range, periods)
         explanation = (
             "Counts anyone who was *ever* observed in the start range, "
             "and at *any* point also observed in the goal range."
         )
     elif ever_calc_mode == "Robust Mobility (Consecutive Years & Horizon)":
-        _, n_achievers_early, n_total_early = robust_achievers_corrected(
-            df[df['year'].between(*early_period)], start_range, goal_range,
-            time_horizon, consec_years, quintile_options)
-        _, n_achievers_late, n_total_late = robust_achievers_corrected(
-            df[df['year'].between(*late_period)], start_range, goal_range,
-            time_horizon, consec_years, quintile_options)
-        reached_early, total_early = n_achievers_early, n_total_early
-        reached_late, total_late = n_achievers_late, n_total_late
+        period_results = robust_goal_periods(panel, start_range, goal_range, time_horizon, consec_years, periods)
         explanation = (
             f"Requires being in the start range, then reaching and remaining in the goal range "
             f"for **{consec_years} consecutive survey years** after a horizon of {time_horizon} years. "
             "Reflects robust mobility, not just one-time movement."
         )
     else:
-        reached_early = total_early = reached_late = total_late = 0
+        period_results = [(0, 0, None) for _ in periods]
         explanation = "Invalid selection."
 
-    if total_early == 0 and total_late == 0:
-        st.warning("No valid individuals found in either period.")
+    if not periods:
+        st.warning("Enter at least one year window, e.g. 1968-1995.")
+    elif all(total == 0 for _, total, _ in period_results):
+        st.warning("No valid individuals found in any period.")
     else:
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("1968–1995", f"{reached_early / total_early:.2%}" if total_early else "N/A", f"{reached_early}/{total_early}")
-        with col2:
-            st.metric("1996–2022", f"{reached_late / total_late:.2%}" if total_late else "N/A", f"{reached_late}/{total_late}")
+        if len(periods) <= 6:
+            for col, label, (reached, total, _) in zip(st.columns(len(periods)), period_labels, period_results):
+                with col:
+                    st.metric(label, f"{reached / total:.2%}" if total else "N/A", f"{reached}/{total}")
+                    if show_ci and total:
+                        st.caption(interval_text(reached, total))
 
         results_df = pd.DataFrame({
-            "Period": ["1968–1995", "1996–2022"],
-            "Reached Goal (%)": [
-                reached_early / total_early * 100 if total_early else 0,
-                reached_late / total_late * 100 if total_late else 0
-            ]
+            "Period": period_labels,
+            "Reached Goal (%)": [reached / total * 100 if total else 0 for reached, total, _ in period_results],
+            "Reached": [reached for reached, _, _ in period_results],
+            "Total": [total for _, total, _ in period_results]
         })
+        if show_ci:
+            lower, upper = mobility.bootstrap_intervals(results_df["Reached"], results_df["Total"], level=ci_level)
+            results_df["CI low (%)"] = lower * 100
+            results_df["CI high (%)"] = upper * 100
+            # px.bar error bars are distances from the bar top
+            error_bars = dict(error_y=results_df["CI high (%)"] - results_df["Reached Goal (%)"],
+                              error_y_minus=results_df["Reached Goal (%)"] - results_df["CI low (%)"])
+        else:
+            error_bars = {}
+        if len(periods) > 6:
+            st.dataframe(results_df, hide_index=True, use_container_width=True)
         fig = px.bar(
             results_df,
             x="Period",
@@ -551,7 +699,8 @@ with tabs[4]:
             },
             title="% Ever Reached Goal Quintile (Calculation Method: " + ever_calc_mode + ")",
             labels={"Reached Goal (%)": "% Reached Goal"},
-            template="plotly_white"
+            template="plotly_white",
+            **error_bars
         )
         fig.update_traces(texttemplate='%{text:.2f}%', textposition="outside")
         st.plotly_chart(fig, use_container_width=True)
@@ -567,32 +716,39 @@ with tabs[5]:
     year_range = st.slider("Select year range to display:", min_value=year_min, max_value=year_max,
                            value=(year_min, year_max), step=1)
 
-    df_range = df[(df['year'] >= year_range[0]) & (df['year'] <= year_range[1])].copy()
-    available_ids = df_range['family_person'].unique()
-    default_ids = list(available_ids[:3])
-    selected_ids = st.multiselect(
-        "Select up to 10 individual IDs to visualize:",
-        options=available_ids,
-        default=default_ids,
-        max_selections=10
-    )
+    selected_ids = trajectories.id_picker(people, panel, year_range, quintile_options, achiever_ids, n_achievers)
 
     if selected_ids:
-        df_plot = df_range[df_range['family_person'].isin(selected_ids)].copy()
-        # Map quintile to number for plotting
-        df_plot['quintile_num'] = df_plot['quintile_label'].map(lambda q: quintile_options.index(q) + 1 if q in quintile_options else np.nan)
-
         col1, col2 = st.columns([4, 1])
         with col2:
             plot_yaxis_multi = st.radio(
                 "Plot y-axis:",
-                ["head_labor_income", "Quintile (1–5)"],
+                ["head_labor_income", quintile_axis_option],
                 index=0,
                 key="plot_yaxis_multi"
             )
+            renderer = st.radio("Rendering:", trajectories.TRAJECTORY_RENDERERS, index=0, key="trajectory_renderer",
+                                help=f"Auto draws one line per person up to {trajectories.WEBGL_THRESHOLD} IDs "
+                                     "and a single WebGL trace above that.")
+            renderer = trajectories.resolve_renderer(renderer, len(selected_ids))
 
         with col1:
-            if plot_yaxis_multi == "head_labor_income":
+            if renderer != "One line per person":
+                yvar = "head_labor_income" if plot_yaxis_multi == "head_labor_income" else "quintile_num"
+                fig = trajectories.trajectory_figure(people, selected_ids, year_range, yvar, renderer, panel)
+                fig.update_layout(
+                    title=f"{'Head Labor Income' if yvar == 'head_labor_income' else 'Income Quintile'} "
+                          f"Trajectories ({len(selected_ids):,} IDs, {renderer})",
+                    yaxis_title="Head Labor Income ($)" if yvar == "head_labor_income" else quintile_axis_title,
+                    xaxis_title="Year",
+                    height=500
+                )
+                if yvar == "head_labor_income":
+                    fig.update_yaxes(tickformat=",")
+                else:
+                    fig.update_yaxes(tickmode='linear', dtick=1)
+            elif plot_yaxis_multi == "head_labor_income":
+                df_plot = people.rows_many(selected_ids, year_range)
                 yvar = "head_labor_income"
                 ytitle = "Head Labor Income ($)"
                 fig = px.line(
@@ -609,8 +765,11 @@ with tabs[5]:
                 )
                 fig.update_yaxes(tickformat=",")
             else:
+                df_plot = people.rows_many(selected_ids, year_range)
+                # Map quintile to number for plotting
+                df_plot['quintile_num'] = quintile_num(df_plot)
                 yvar = "quintile_num"
-                ytitle = "Income Quintile (1=Lowest, 5=Top)"
+                ytitle = quintile_axis_title
                 fig = px.line(
                     df_plot, x="year", y=yvar, color="family_person", line_group="family_person",
                     markers=True, title="Income Quintile Trajectories",
@@ -623,7 +782,7 @@ with tabs[5]:
                     legend_title_text="ID",
                     height=500
                 )
-                fig.update_yaxes(tickmode='linear', dtick=1, range=[0.9, 5.1])
+                fig.update_yaxes(tickmode='linear', dtick=1, range=[0.9, len(quintile_options) + 0.1])
 
             st.plotly_chart(fig, use_container_width=True)
 
@@ -632,8 +791,12 @@ with tabs[5]:
 
     with st.expander("How to use this tab"):
         st.markdown(
-            "- **Select up to 10 people** to visualize their income journeys.\n"
+            "- **Select up to 200 people** (or add the Mobility Calculator's achievers) to visualize their income journeys.\n"
             "- **Toggle the y-axis** between Head Labor Income and Income Quintile.\n"
+            "- **Rendering:** large selections are drawn as one WebGL trace; *Quantile bands* summarizes them "
+            "as the per-year median with 25–75 and 10–90 percentile bands.\n"
+            "- **Search** by the start of an ID and **filter** to the calculator's achievers or to people whose first "
+            "quintile in the year range is a given quintile; only the top matches are listed.\n"
             "- Use the slider to restrict the year range shown.\n"
             "- Useful for exploring heterogeneity in income dynamics."
         )
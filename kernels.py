@@ -0,0 +1,56 @@
+# Optional compiled kernels (numba) for the robust-mobility scan.
+# numba is an OPTIONAL dependency (listed as such in requirements.txt; `pip install numba` enables it):
+# without it HAVE_NUMBA is False and mobility.py keeps using its NumPy bitmask engine, so results never
+# depend on whether the kernel is available.
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        # Plain-Python stand-in so the kernel stays importable (and testable) without numba
+        if args and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+
+@njit(cache=True)
+def robust_scan(offsets, years, codes, start_ok, goal_ok, time_horizon, consec_years, restrict_year, first_year):
+    # One pass over every person's rows (sorted by year, valid quintiles only):
+    #   denominator[p] -> some start year sy with the person still observed at sy + horizon + window - 1
+    #   hits[p]        -> bit (sy - first_year) set for every start year sy with the person also in the
+    #                     goal range in every calendar year sy + horizon .. + window - 1 (achiever: hits != 0)
+    n = len(offsets) - 1
+    denominator = np.zeros(n, dtype=np.bool_)
+    hits = np.zeros(n, dtype=np.uint64)
+    for p in range(n):
+        lo = offsets[p]
+        hi = offsets[p + 1]
+        if lo == hi:
+            continue
+        last = years[hi - 1]
+        j = lo  # first row with year >= the current target; only ever moves forward
+        for i in range(lo, hi):
+            sy = years[i]
+            if not start_ok[codes[i]]:
+                continue
+            if restrict_year >= 0 and sy != restrict_year:
+                continue
+            if last < sy + time_horizon + consec_years - 1:
+                break  # later starts can't fit either
+            denominator[p] = True
+            target = sy + time_horizon
+            while j < hi and years[j] < target:
+                j += 1
+            ok = True
+            for k in range(consec_years):
+                r = j + k
+                if r >= hi or years[r] != target + k or not goal_ok[codes[r]]:
+                    ok = False
+                    break
+            if ok:
+                hits[p] |= np.uint64(1) << np.uint64(sy - first_year)
+    return denominator, hits
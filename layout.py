@@ -3,18 +3,65 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
+import dataset
+import mobility
+import trajectories
+import transitions
 
 st.set_page_config(layout="wide", page_title="The American Dream: A Dashboard for Relative Economic Mobility")
 
-@st.cache_data
+# 1992 is REMOVED FROM THE WHOLE DATASET as it has 0 for everyone in 1992--flawed
+EXCLUDED_YEARS = (1992,)
+
+@st.cache_resource(show_spinner="Attaching dataset...")
 def load_data(path):
-    return pd.read_csv(path)
+    # ONE read-only, memory-mapped frame per server process (st.cache_data would pickle/copy it on every
+    # rerun); the mapped columns are shared through the OS page cache by all sessions and processes.
+    # EXCLUDED_YEARS are dropped before the binary cache is written, so every helper below reads the
+    # filtered frame as is. Never write into df -- derive new frames instead.
+    return dataset.open_frame(path, exclude_years=EXCLUDED_YEARS)
 
 DATA_PATH = "dream_92.csv"
 
 df = load_data(DATA_PATH)
 
-df = df[df['year'] != 1992].copy()  # <-- REMOVE 1992 FROM WHOLE DATASET as it has 0 for everyone in 1992--flawed
+@st.cache_resource(show_spinner="Loading quintile thresholds...")
+def load_threshold_table(path):
+    # Census quintile thresholds, one row per year (EXCLUDED_YEARS dropped), split off the rows at load time
+    return dataset.load_thresholds(path, exclude_years=EXCLUDED_YEARS)
+
+thresholds = load_threshold_table(DATA_PATH)
+
+@st.cache_resource(show_spinner="Ranking incomes within each year...")
+def load_ranks(path):
+    # Per-year within-sample percentile rank of every row, shared by the rank schemes
+    return dataset.percentile_ranks(load_data(path))
+
+@st.cache_resource(show_spinner="Re-bucketing incomes...")
+def load_scheme_labels(path, scheme):
+    # dataset.scheme_labels on the frame without EXCLUDED_YEARS, once per data file and scheme
+    ranks = load_ranks(path) if dataset.rank_bins(scheme) else None
+    return dataset.scheme_labels(load_data(path), scheme, load_threshold_table(path), ranks)
+
+@st.cache_resource(show_spinner="Encoding quintile panel...")
+def load_panel(path, scheme=dataset.CSV_SCHEME):
+    # int8 (person x year) quintile matrix + presence bitmasks, built once per data file and scheme
+    labelled, labels = load_scheme_labels(path, scheme)
+    return mobility.build_panel(labelled, labels)
+
+@st.cache_resource(show_spinner="Indexing trajectories...")
+def load_person_index(path):
+    # family_person -> contiguous block of the person/year-sorted rows
+    return dataset.person_index(load_data(path))
+
+people = load_person_index(DATA_PATH)
+
+@st.cache_resource(show_spinner="Summarizing income by year...")
+def load_year_stats(path):
+    # Income mean, median and std (linear + log) for every year; the thresholds come from load_threshold_table
+    return dataset.year_statistics(load_data(path))
+
+year_stats = load_year_stats(DATA_PATH)
 
 
 # Sidebar controls
@@ -24,18 +71,33 @@ st.sidebar.header("Mobility Calculator Options")
 # years_with_all = ['All years'] + years
 years = sorted([y for y in df['year'].unique()])
 years_with_all = ['All years'] + years
-quintile_options = ["lowest", "second", "third", "fourth", "top"]
 comp_options = ["Exact", "No higher than", "No lower than"]
+threshold_scheme = st.sidebar.selectbox("Quintile thresholds:", dataset.THRESHOLD_SCHEMES, index=0,
+                                        help="Re-bucket head_labor_income against other per-year cutoffs.")
+if threshold_scheme == dataset.CUSTOM_RANK_SCHEME:
+    n_rank_bins = st.sidebar.number_input("Number of rank bins:", min_value=2, max_value=20, value=4,
+                                          help="Equal-width bins of the per-year percentile rank.")
+    threshold_scheme = dataset.custom_rank_scheme(n_rank_bins)
+panel = load_panel(DATA_PATH, threshold_scheme)
+quintile_options = list(panel.quintile_options)
+# Bucket-number axis labels built from the active scheme's labels (5 quintiles, 10 deciles, ...)
+quintile_axis_option, quintile_axis_title = trajectories.quintile_axis(quintile_options)
 
 start_year = st.sidebar.selectbox("Select A Start Year (childhood):", years_with_all, index=0)
 start_quintile_comp = st.sidebar.selectbox("Start Quintile Comparison:", comp_options, index=0)
 start_quintile = st.sidebar.selectbox("Select A Start Quintile (childhood):", quintile_options, index=0)
-time_horizon = st.sidebar.number_input("Time horizon (years):", min_value=1, max_value=40, value=10)
+time_horizon = st.sidebar.number_input("Time horizon (years):", min_value=1, max_value=mobility.MAX_HORIZON, value=10)
 goal_quintile_comp = st.sidebar.selectbox("GOAL Quintile Comparison:", comp_options, index=0)
-goal_quintile = st.sidebar.selectbox("Select A GOAL Quintile:", quintile_options, index=4)
+goal_quintile = st.sidebar.selectbox("Select A GOAL Quintile:", quintile_options,
+                                     index=len(quintile_options) - 1)
+show_ci = st.sidebar.checkbox("Bootstrap confidence interval", value=True,
+                              help=f"Percentile bootstrap over people ({mobility.BOOTSTRAP_RESAMPLES:,} resamples) "
+                                   "from the counts of one engine pass.")
+ci_level = st.sidebar.select_slider("Confidence level:", options=mobility.CI_LEVELS, value=0.95,
+                                    format_func=lambda level: f"{level:.0%}", disabled=not show_ci)
 
 # -- Remove 1992 from years list for sidebar and all logic
-years = sorted([y for y in df['year'].unique() if y != 1992])
+years = sorted(df['year'].unique())
 years_with_all = ['All years'] + years
 
 def get_quintile_range(q, comp, q_opts):
@@ -94,46 +156,14 @@ def get_quintile_range(q, comp, q_opts):
 #
 #     return achievers, len(achievers), len(denominator), achievers_map
 
-@st.cache_data
+# cache_resource: results hold PersonSet bitmaps tied to the shared panel -- don't pickle/copy them per rerun
+@st.cache_resource(max_entries=256)
 def robust_achievers_single_year(
-    df, start_quintile_range, goal_quintile_range, time_horizon, start_year=None
+    _panel, start_quintile_range, goal_quintile_range, time_horizon, start_year=None, scheme=dataset.CSV_SCHEME
 ):
-    df = df[df['quintile_label'].isin(quintile_options)].sort_values(["family_person", "year"])
-    achievers = []
-    denominator = set()
-    achievers_map = dict()
-
-    for pid, group in df.groupby("family_person"):
-        years = group['year'].values
-        quintiles = group['quintile_label'].values
-
-        # Get valid start years
-        if start_year is None:
-            possible_starts = years[np.isin(quintiles, start_quintile_range)]
-        else:
-            mask = (years == int(start_year)) & np.isin(quintiles, start_quintile_range)
-            possible_starts = years[mask]
-
-        if len(possible_starts) == 0:
-            continue
-
-        found_windows = []
-        for sy in possible_starts:
-            goal_y = sy + time_horizon
-            if goal_y not in years:
-                continue
-            idx = np.where(years == goal_y)[0][0]
-            denominator.add(pid)
-            if quintiles[idx] in goal_quintile_range:
-                found_windows.append((sy, goal_y))
-
-        if found_windows:
-            achievers.append(pid)
-            achievers_map[pid] = found_windows
-        elif len(possible_starts) > 0:
-            denominator.add(pid)
-
-    return achievers, len(achievers), len(denominator), achievers_map
+    # Queries the shared quintile panel; same result as the old per-person loop
+    # (kept as mobility.horizon_achievers_reference). `scheme` names _panel's threshold scheme (cache key).
+    return mobility.horizon_achievers(_panel, start_quintile_range, goal_quintile_range, time_horizon, start_year)
 
 
 
@@ -143,7 +173,8 @@ quintile_colors = {
     'fourth': '#1f77b4',
     'third': '#2ca02c',
     'second': '#ff7f0e',
-    'lowest': '#d62728'
+    'lowest': '#d62728',
+    'top 5%': '#8c564b'
 }
 
 # --- Tab Layout ---
@@ -163,31 +194,43 @@ with tabs[0]:
     goal_range = get_quintile_range(goal_quintile, goal_quintile_comp, quintile_options)
 
     if start_year == "All years":
-        result = robust_achievers_single_year(df, start_range, goal_range, time_horizon)
+        result = robust_achievers_single_year(panel, start_range, goal_range, time_horizon, scheme=threshold_scheme)
     else:
-        result = robust_achievers_single_year(df, start_range, goal_range, time_horizon, int(start_year))
-    achiever_ids, n_achievers, n_total, achievers_map = result
+        result = robust_achievers_single_year(panel, start_range, goal_range, time_horizon, int(start_year),
+                                              scheme=threshold_scheme)
+    achiever_ids, n_achievers, n_total, achiever_windows = result
 
     if n_total == 0:
         st.warning("No valid cases found for these criteria.")
     else:
         st.success(f"Probability: {n_achievers / n_total:.2%} ({n_achievers}/{n_total})")
+        if show_ci:
+            st.caption(f"Bootstrap over the {n_total:,} people in the denominator. "
+                       f"{mobility.interval_text(n_achievers, n_total, ci_level, digits=2)}")
         st.info(f"Achiever IDs (first 20): {achiever_ids[:20]}")
 
     # Plot individual trajectory
     if achiever_ids:
         st.subheader("Individual Mobility Trajectory")
-        plot_id = st.selectbox("Select an individual ID to plot trajectory:", achiever_ids, index=0)
+        # Only the page of IDs shown in the picker is materialized from the achiever bitmap
+        page_size = 500
+        page_start = 0
+        if n_achievers > page_size:
+            page_start = st.number_input(f"Browse achievers ({page_size} per page), starting at #:", min_value=1,
+                                         max_value=n_achievers, value=1, step=page_size) - 1
+        plot_id = st.selectbox("Select an individual ID to plot trajectory:",
+                               achiever_ids[page_start:page_start + page_size], index=0)
         col1, col2 = st.columns([4, 1])
         with col2:
-            plot_yaxis = st.radio("Plot y-axis:", ["Quintile (1–5)", "head_labor_income"], index=0)
+            plot_yaxis = st.radio("Plot y-axis:", [quintile_axis_option, "head_labor_income"], index=0)
         # person_data = df[(df['family_person'] == plot_id) & (df['head_labor_income'] > 0)].copy()
-        person_data = df[(df['family_person'] == plot_id)].copy()
-        person_data = person_data.sort_values("year")
-        quintile_num_map = {q: i+1 for i, q in enumerate(quintile_options)}
-        person_data['quintile_num'] = person_data['quintile_label'].map(quintile_num_map)
-        yvar = 'quintile_num' if plot_yaxis == "Quintile (1–5)" else 'head_labor_income'
-        ytitle = "Income Quintile (1=Lowest, 5=Top)" if yvar == "quintile_num" else "Head Labor Income ($)"
+        # Already sorted by year; a slice of the person index instead of a full-table scan
+        person_data = people.rows(plot_id).copy()
+        # Bucket numbers under the selected threshold scheme
+        codes = panel.codes_at(person_data['family_person'].to_numpy(), person_data['year'].to_numpy())
+        person_data['quintile_num'] = np.where(codes > 0, codes, np.nan)
+        yvar = 'quintile_num' if plot_yaxis == quintile_axis_option else 'head_labor_income'
+        ytitle = quintile_axis_title if yvar == "quintile_num" else "Head Labor Income ($)"
         fig = px.line(person_data, x="year", y=yvar, title=f"Trajectory for ID {plot_id}", markers=True)
         if yvar == "quintile_num":
             fig.update_yaxes(title=ytitle, tickmode='linear', dtick=1)
@@ -195,8 +238,8 @@ with tabs[0]:
             fig.update_yaxes(title=ytitle, tickformat=",", rangemode="tozero", showgrid=True)
 
         # --- Add horizon lines for each success window this individual achieved ---
-        sy_goal_pairs = achievers_map.get(plot_id, [])
-        for sy, gy in sy_goal_pairs:
+        # (start, goal) windows recorded by the engine pass, expanded for this ID only
+        for sy, gy, _ in achiever_windows.of(plot_id):
             if sy != 1992:
                 fig.add_vline(x=sy, line_dash="dash", line_color="green", annotation_text="Start",
                               annotation_position="top left")
@@ -240,9 +283,9 @@ with tabs[0]:
 # ========== TAB 1: Matrix Check ==========
 with tabs[1]:
     st.header("Mobility Matrix Check")
-    quintile_order = ['lowest', 'second', 'third', 'fourth', 'top']
-    df['quintile_label'] = pd.Categorical(df['quintile_label'], categories=quintile_order, ordered=True)
-    transition_counts = df.groupby(['year', 'quintile_label'])['family_person'].nunique().reset_index()
+    quintile_order = quintile_options
+    # Per-year quintile counts, computed once per dataset from the shared panel's integer codes
+    transition_counts = mobility.quintile_count_frame(panel)
     fig_matrix = px.bar(
         transition_counts,
         x='year',
@@ -256,6 +299,9 @@ with tabs[1]:
     )
     st.plotly_chart(fig_matrix, use_container_width=True)
 
+    # Transition matrices between consecutive survey years and after a time horizon
+    transitions.transition_heatmaps(panel, start_year, time_horizon)
+
     # Animated Income Distribution & Static Side-by-Side
     st.subheader("Income Quintile Distribution: 1968, 1993, 2022")
     percents = {
@@ -361,11 +407,11 @@ with tabs[1]:
 with tabs[2]:
     st.header("Income Quintile Thresholds Over Time")
     quintile_cols = ['Lowest', 'Second', 'Third', 'Fourth', 'Lower.limit.of.top.5.percent..dollars.']
-    existing_cols = [col for col in quintile_cols if col in df.columns]
+    existing_cols = [col for col in quintile_cols if col in thresholds.columns]
     if not existing_cols:
         st.error("None of the expected quintile columns were found in the dataset.")
     else:
-        quintiles_by_year = df.groupby('year')[existing_cols].mean().reset_index()
+        quintiles_by_year = thresholds[['year'] + existing_cols]
         melted = quintiles_by_year.melt(id_vars='year', var_name='Quintile', value_name='Threshold')
         label_map = {
             'Lowest': '1st Quintile (Lowest)',
@@ -411,7 +457,8 @@ with tabs[2]:
 # ========== TAB 3: Income Trends (Mean, Median, Std Dev, with log plot) ==========
 with tabs[3]:
     st.header("Income Trends: Mean, Median, & Std Dev (Linear & Log Scales)")
-    income_stats = df.groupby('year')['head_labor_income'].agg(['mean', 'median', 'std']).reset_index()
+    # Precomputed once per dataset (dataset.year_statistics)
+    income_stats = year_stats[['year', 'mean', 'median', 'std']]
     # Linear plot
     fig_income = go.Figure([
         go.Scatter(x=income_stats.year, y=income_stats['mean'], name='Mean', line_color='blue'),
@@ -426,17 +473,7 @@ with tabs[3]:
     st.plotly_chart(fig_income, use_container_width=True)
 
     # Log plot with correct std dev in log space
-    yearly = []
-    for year, group in df.groupby('year'):
-        incomes = group['head_labor_income']
-        log_incomes = np.log(incomes[incomes > 0])
-        yearly.append({
-            'year': year,
-            'log_mean': log_incomes.mean(),
-            'log_median': np.median(log_incomes),
-            'log_std': log_incomes.std()
-        })
-    income_stats_log = pd.DataFrame(yearly).sort_values('year')
+    income_stats_log = year_stats[['year', 'log_mean', 'log_median', 'log_std']]
 
     fig_income_log = go.Figure([
         go.Scatter(x=income_stats_log.year, y=income_stats_log['log_mean'], name='Log(Mean)', line_color='blue'),
@@ -517,21 +554,24 @@ with tabs[4]:
     year_range = st.slider("Select year range to display:", min_value=year_min, max_value=year_max,
                            value=(year_min, year_max), step=1)
 
-    # Filter the dataframe for the selected year range:
-    df_range = df[(df['year'] >= year_range[0]) & (df['year'] <= year_range[1])].copy()
-
-    # Multi-select box for up to 10 IDs:
-    available_ids = df_range['family_person'].unique()
-    default_ids = list(available_ids[:3])  # or random sample
-    selected_ids = st.multiselect(
-        "Select up to 10 individual IDs to visualize:",
-        options=available_ids,
-        default=default_ids,
-        max_selections=20
-    )
+    selected_ids = trajectories.id_picker(people, panel, year_range, quintile_options, achiever_ids, n_achievers)
+    renderer = st.radio("Rendering:", trajectories.TRAJECTORY_RENDERERS, index=0, horizontal=True,
+                        key="trajectory_renderer",
+                        help=f"Auto draws one line per person up to {trajectories.WEBGL_THRESHOLD} IDs and a "
+                             "single WebGL trace above that.")
+    renderer = trajectories.resolve_renderer(renderer, len(selected_ids))
 
-    if selected_ids:
-        df_plot = df_range[df_range['family_person'].isin(selected_ids)].copy()
+    if selected_ids and renderer != "One line per person":
+        fig = trajectories.trajectory_figure(people, selected_ids, year_range, 'head_labor_income', renderer)
+        fig.update_layout(
+            title=f"Head Labor Income Trajectories ({len(selected_ids):,} IDs, {renderer})",
+            yaxis_title="Head Labor Income ($)",
+            xaxis_title="Year",
+            height=500
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    elif selected_ids:
+        df_plot = people.rows_many(selected_ids, year_range)
         fig = px.line(
             df_plot,
             x="year",
@@ -555,7 +595,11 @@ with tabs[4]:
 
     with st.expander("How to use this tab"):
         st.markdown(
-            "- **Select up to 20 people** to visualize their income journeys.\n"
+            "- **Select up to 200 people** (or add the Mobility Calculator's achievers) to visualize their income journeys.\n"
+            "- **Rendering:** large selections are drawn as one WebGL trace; *Quantile bands* summarizes them "
+            "as the per-year median with 25–75 and 10–90 percentile bands.\n"
+            "- **Search** by the start of an ID and **filter** to the calculator's achievers or to people whose first "
+            "quintile in the year range is a given quintile; only the top matches are listed.\n"
             "- Use the slider to restrict the year range shown.\n"
             "- Useful for exploring heterogeneity in income dynamics."
         )
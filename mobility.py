@@ -0,0 +1,861 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import kernels
+
+QUINTILE_OPTIONS = ["lowest", "second", "third", "fourth", "top"]
+# Sidebar bounds of the time horizon and robustness window (hope.py, layout.py); the horizon x window
+# sweep and the offline cube (cube.py) cover exactly this range
+MAX_HORIZON = 40
+MAX_WINDOW = 15
+
+
+# --- Shared quintile panel ---
+@dataclass(frozen=True, eq=False)
+class QuintilePanel:
+    # Built ONCE after load_data and queried by every mobility calculator instead of the long frame.
+    ids: np.ndarray           # person code -> family_person
+    years: np.ndarray         # year index -> calendar year (every year from first to last survey)
+    codes: np.ndarray         # int8 (person x year): 1..5 for lowest..top, 0 = no valid quintile
+    present: np.ndarray       # uint64 bitmask per person, bit j set when observed in years[j]
+    first_year: np.ndarray    # int16 per person, -1 if never observed
+    last_year: np.ndarray
+    quintile_options: tuple = tuple(QUINTILE_OPTIONS)
+
+    @property
+    def n_years(self):
+        return len(self.years)
+
+    def year_index(self, year):
+        # Column of a calendar year, or None when it falls outside the panel
+        col = int(year) - int(self.years[0]) if self.n_years else -1
+        return col if 0 <= col < self.n_years else None
+
+    def mask(self, quintile_range):
+        # Boolean (person x year) membership in a quintile range via a code lookup table
+        return range_lookup(quintile_range, list(self.quintile_options))[self.codes]
+
+    def codes_at(self, pids, years):
+        # Quintile code (1..K, 0 = none) of each (family_person, year) pair, e.g. for a trajectory plot
+        pids, years = np.asarray(pids), np.asarray(years, dtype=np.int64)
+        out = np.zeros(len(pids), dtype=np.int8)
+        if not len(self.ids) or not self.n_years:
+            return out
+        code = np.minimum(np.searchsorted(self.ids, pids), len(self.ids) - 1)
+        col = years - int(self.years[0])
+        ok = (self.ids[code] == pids) & (col >= 0) & (col < self.n_years)
+        out[ok] = self.codes[code[ok], col[ok]]
+        return out
+
+    def between(self, lo, hi):
+        # Same people (same person codes), restricted to survey years lo..hi -- a column slice.
+        # Memoized so a period keeps hitting the same stage caches below.
+        return _between(self, int(lo), int(hi))
+
+
+@lru_cache(maxsize=16)
+def _between(panel, lo, hi):
+    if not panel.n_years:
+        return panel
+    first = int(panel.years[0])
+    a = min(max(lo - first, 0), panel.n_years)
+    b = max(min(hi - first + 1, panel.n_years), a)
+    return _from_codes(panel.ids, panel.years[a:b], panel.codes[:, a:b], panel.quintile_options)
+
+
+def _pack_years(mask):
+    # (person x year) bool -> uint64 bitmask per person
+    shifts = np.arange(mask.shape[1], dtype=np.uint64)
+    return np.bitwise_or.reduce(mask.astype(np.uint64) << shifts, axis=1)
+
+
+def _from_codes(ids, years, codes, quintile_options):
+    observed = codes > 0
+    seen = observed.any(axis=1)
+    n_years = codes.shape[1]
+    first = np.where(seen, years[np.argmax(observed, axis=1)] if n_years else -1, -1)
+    last = np.where(seen, years[n_years - 1 - np.argmax(observed[:, ::-1], axis=1)] if n_years else -1, -1)
+    return QuintilePanel(ids=ids, years=years, codes=codes, present=_pack_years(observed),
+                         first_year=first.astype(np.int16), last_year=last.astype(np.int16),
+                         quintile_options=tuple(quintile_options))
+
+
+def build_panel(df, quintile_options=QUINTILE_OPTIONS):
+    df = df[df['quintile_label'].isin(quintile_options)]
+    pid_codes, ids = pd.factorize(df['family_person'], sort=True)
+    year_vals = df['year'].to_numpy(dtype=np.int64)
+    if len(year_vals) == 0:
+        return _from_codes(np.asarray(ids), np.zeros(0, dtype=np.int16), np.zeros((0, 0), dtype=np.int8),
+                           quintile_options)
+    first_year = int(year_vals.min())
+    years = np.arange(first_year, int(year_vals.max()) + 1, dtype=np.int16)
+    if len(years) > 64:
+        raise ValueError(f"Panel spans {len(years)} years; presence bitmasks hold at most 64.")
+    codes = np.zeros((len(ids), len(years)), dtype=np.int8)
+    # Works for plain string labels and for the categorical labels from the binary cache
+    labels = pd.Categorical(df['quintile_label'], categories=list(quintile_options)).codes + 1
+    codes[pid_codes, year_vals - first_year] = labels
+    return _from_codes(np.asarray(ids), years, codes, quintile_options)
+
+
+def range_lookup(quintile_range, quintile_options=QUINTILE_OPTIONS):
+    # Boolean lookup table indexed by quintile code (code 0 = not observed is never in range)
+    lookup = np.zeros(len(quintile_options) + 1, dtype=bool)
+    for q in quintile_range:
+        lookup[quintile_options.index(q) + 1] = True
+    return lookup
+
+
+def _start_mask(panel, start_quintile_range, restrict_start_year=None):
+    starts = panel.mask(start_quintile_range)
+    if restrict_start_year is not None:
+        keep = np.zeros(panel.n_years, dtype=bool)
+        col = panel.year_index(restrict_start_year)
+        if col is not None:
+            keep[col] = True
+        starts &= keep
+    return starts
+
+
+def _frozen(arr):
+    arr.setflags(write=False)
+    return arr
+
+
+# --- Person sets ---
+class PersonSet:
+    # A population (achievers, denominator, ...) as a packed bitmap over the panel's dense person codes.
+    # Union/intersection are byte-wise ops, storage is n/8 bytes (zlib for caches), and IDs are only
+    # materialized for the slice that is actually displayed.
+    __slots__ = ("ids", "bits", "_count")
+
+    def __init__(self, ids, bits, count=None):
+        self.ids = ids
+        self.bits = bits
+        self._count = int(np.unpackbits(bits).sum()) if count is None else int(count)
+
+    @classmethod
+    def from_mask(cls, ids, mask):
+        return cls(ids, np.packbits(mask), np.count_nonzero(mask))
+
+    @classmethod
+    def from_bytes(cls, ids, data, count=None):
+        return cls(ids, np.frombuffer(zlib.decompress(data), dtype=np.uint8), count)
+
+    def to_bytes(self):
+        return zlib.compress(self.bits.tobytes(), 6)
+
+    def mask(self):
+        return np.unpackbits(self.bits, count=len(self.ids)).astype(bool)
+
+    def codes(self):
+        return np.flatnonzero(np.unpackbits(self.bits, count=len(self.ids)))
+
+    def mask_over(self, ids):
+        # Boolean over another sorted id array (e.g. the person index): id is in the set, read straight
+        # off the bitmap without materializing the member ids
+        if ids is self.ids:
+            return self.mask()
+        ids = np.asarray(ids, dtype=self.ids.dtype)
+        if not len(self.ids):
+            return np.zeros(len(ids), dtype=bool)
+        code = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return (self.ids[code] == ids) & self.mask()[code]
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __getitem__(self, item):
+        # Position(s) in person-code order -> family_person id(s)
+        if isinstance(item, slice):
+            return list(self.ids[self.codes()[item]])
+        return self.ids[self.codes()[item]]
+
+    def __iter__(self):
+        for start in range(0, self._count, 1024):
+            yield from self[start:start + 1024]
+
+    def __contains__(self, pid):
+        # ids are sorted (build_panel factorizes with sort=True)
+        code = int(np.searchsorted(self.ids, pid))
+        if code >= len(self.ids) or self.ids[code] != pid:
+            return False
+        return bool(self.bits[code >> 3] & (0x80 >> (code & 7)))
+
+    def _combine(self, other, bits):
+        if len(self.ids) != len(other.ids):
+            raise ValueError("PersonSets come from different panels")
+        return PersonSet(self.ids, bits)
+
+    def __or__(self, other):
+        return self._combine(other, self.bits | other.bits)
+
+    def __and__(self, other):
+        return self._combine(other, self.bits & other.bits)
+
+    def __sub__(self, other):
+        return self._combine(other, self.bits & ~other.bits)
+
+    def __repr__(self):
+        return f"PersonSet({self._count} of {len(self.ids)})"
+
+
+class AchieverWindows:
+    # Every qualifying window of every achiever, recorded by the engine pass that counted them:
+    # one uint64 per achiever with bit t set when a window starts from year years[t], so the
+    # trajectory plot never re-derives (and can never disagree with) the counting logic.
+    __slots__ = ("ids", "codes", "bits", "first_year", "time_horizon", "consec_years")
+
+    def __init__(self, ids, codes, bits, first_year, time_horizon, consec_years):
+        self.ids = ids                    # panel person codes -> family_person
+        self.codes = codes                # sorted person codes of the achievers
+        self.bits = bits                  # qualifying start-year bits, aligned with codes
+        self.first_year = int(first_year)
+        self.time_horizon = int(time_horizon)
+        self.consec_years = int(consec_years)
+
+    @classmethod
+    def from_hits(cls, panel, hit_bits, time_horizon, consec_years):
+        codes = np.flatnonzero(hit_bits)
+        first_year = int(panel.years[0]) if panel.n_years else 0
+        return cls(panel.ids, codes, hit_bits[codes], first_year, time_horizon, consec_years)
+
+    def of(self, pid):
+        # -> [(start_year, first_goal_year, last_goal_year)] in start-year order, [] for non-achievers
+        code = int(np.searchsorted(self.ids, pid))
+        if code >= len(self.ids) or self.ids[code] != pid:
+            return []
+        i = int(np.searchsorted(self.codes, code))
+        if i >= len(self.codes) or self.codes[i] != code:
+            return []
+        bits = int(self.bits[i])
+        starts = [self.first_year + t for t in range(64) if bits >> t & 1]
+        return [(sy, sy + self.time_horizon, sy + self.time_horizon + self.consec_years - 1) for sy in starts]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+# --- Incremental stages ---
+# Each stage is memoized on exactly the parameters it depends on (panels hash by identity), so when one
+# sidebar knob moves only the stages downstream of it are recomputed. Year masks are uint64 bitmasks per
+# person (bit j = year index j), which makes the horizon a shift and the final combine O(people).
+@lru_cache(maxsize=32)
+def start_stage(panel, start_range, restrict_start_year=None):
+    # -> (start-year bits, first start column or -1); depends only on the start range/year
+    starts = _start_mask(panel, list(start_range), restrict_start_year)
+    first = np.where(starts.any(axis=1), np.argmax(starts, axis=1), -1)
+    return _frozen(_pack_years(starts)), _frozen(first)
+
+
+@lru_cache(maxsize=32)
+def goal_stage(panel, goal_range):
+    # Goal-membership bits; depends only on the goal range
+    return _frozen(_pack_years(panel.mask(list(goal_range))))
+
+
+@lru_cache(maxsize=128)
+def window_stage(panel, goal_range, consec_years):
+    # Bit u set -> in the goal range in EVERY calendar year u .. u + consec_years - 1.
+    # Built from the (cached) window one year shorter, so stepping the robustness slider is one AND.
+    goals = goal_stage(panel, goal_range)
+    if consec_years <= 1:
+        return goals
+    shorter = window_stage(panel, goal_range, consec_years - 1)
+    return _frozen(shorter & (goals >> np.uint64(consec_years - 1)))
+
+
+@lru_cache(maxsize=32)
+def goal_runs(panel, goal_range):
+    # int8 (person x year): length of the unbroken run of goal-range years starting at each year (0 when
+    # not in range), one backward pass -- a goal window of any length C starts at u iff runs[:, u] >= C
+    in_goal = panel.mask(list(goal_range))
+    runs = np.zeros(in_goal.shape, dtype=np.int8)
+    following = np.zeros(in_goal.shape[0], dtype=np.int8)
+    for col in range(panel.n_years - 1, -1, -1):
+        following = np.where(in_goal[:, col], following + 1, 0).astype(np.int8)
+        runs[:, col] = following
+    return _frozen(runs)
+
+
+@lru_cache(maxsize=32)
+def goal_spans(panel, goal_range):
+    # Run-length index of goal membership: every maximal run of consecutive goal-range years as a sorted
+    # key person * n_years + first column and an int8 length, so one searchsorted finds the run (if any)
+    # covering any (person, year) -- a few bytes per run instead of a person x year matrix per window length
+    runs = goal_runs(panel, goal_range)
+    begins = runs > 0
+    begins[:, 1:] &= runs[:, :-1] == 0
+    people, cols = np.nonzero(begins)
+    return _frozen(people.astype(np.int64) * panel.n_years + cols), _frozen(runs[people, cols])
+
+
+@lru_cache(maxsize=16)
+def last_column(panel):
+    # Last observed year index per person, -1 if never observed
+    offset = int(panel.years[0]) if panel.n_years else 0
+    return _frozen(np.where(panel.last_year >= 0, panel.last_year.astype(np.int64) - offset, -1))
+
+
+@lru_cache(maxsize=32)
+def start_pairs(panel, start_range):
+    # -> (person codes, columns, earliest column per person or -1) of every start-range (person, year),
+    # sorted by person then year -- the candidate start years the "runs" backend checks
+    people, cols = np.nonzero(panel.mask(list(start_range)))
+    first_start = np.full(panel.codes.shape[0], -1, dtype=np.int64)
+    first_start[people[::-1]] = cols[::-1]        # written in reverse, so the smallest column lands last
+    return _frozen(people), _frozen(cols), _frozen(first_start)
+
+
+@lru_cache(maxsize=64)
+def cohort_stage(panel, start_range, start_year):
+    # -> (start column or None, sorted person codes in the start range in that one year): the specific-year
+    # queries below read one panel column here, then only the cohort's horizon/window columns
+    col = panel.year_index(start_year)
+    if col is None:
+        return None, _frozen(np.zeros(0, dtype=np.int64))
+    in_range = range_lookup(list(start_range), list(panel.quintile_options))[panel.codes[:, col]]
+    return col, _frozen(np.flatnonzero(in_range))
+
+
+def _cohort_hits(panel, cohort, col, goal_range, first_goal_col, n_goal_cols):
+    # uint64 start-year bits per person: bit col for cohort members in the goal range in every one of the
+    # n_goal_cols columns from first_goal_col (all inside the panel), 0 for everyone else
+    hit_bits = np.zeros(panel.codes.shape[0], dtype=np.uint64)
+    if col is None or first_goal_col + n_goal_cols > panel.n_years:
+        return hit_bits
+    goal_ok = range_lookup(list(goal_range), list(panel.quintile_options))
+    window = panel.codes[cohort[:, None], first_goal_col + np.arange(n_goal_cols)]
+    hit_bits[cohort[goal_ok[window].all(axis=1)]] = np.uint64(1) << np.uint64(col)
+    return hit_bits
+
+
+@lru_cache(maxsize=16)
+def first_codes(panel):
+    # Quintile code of each person's first labelled year in the panel, 0 if never labelled
+    observed = panel.codes > 0
+    first = np.argmax(observed, axis=1)
+    return _frozen(np.where(observed.any(axis=1), panel.codes[np.arange(len(first)), first], 0).astype(np.int8))
+
+
+def _shift_down(bits, n):
+    # bits >> n, with shifts past the panel width giving 0
+    if n >= 64:
+        return np.zeros_like(bits)
+    return bits >> np.uint64(n)
+
+
+@lru_cache(maxsize=16)
+def panel_rows(panel):
+    # CSR view for the compiled kernels: observed (person, year) rows sorted by person then year
+    people, cols = np.nonzero(panel.codes)
+    offsets = np.zeros(panel.codes.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(people, minlength=panel.codes.shape[0]), out=offsets[1:])
+    return _frozen(offsets), _frozen(panel.years[cols].astype(np.int32)), _frozen(panel.codes[people, cols])
+
+
+# --- Year x quintile aggregates (Matrix Check tab) ---
+# Integer-code counting over the panel, memoized per panel (= per dataset); the frame is never touched.
+@lru_cache(maxsize=4)
+def quintile_counts(panel):
+    # (year x quintile) people per quintile code 1..K; a person has one code per year, so this is the
+    # distinct-person count the tab used to get from groupby(...).nunique()
+    k = len(panel.quintile_options) + 1
+    cols = np.broadcast_to(np.arange(panel.n_years), panel.codes.shape)
+    counts = np.bincount((cols * k + panel.codes).ravel(), minlength=panel.n_years * k)
+    return _frozen(counts.reshape(panel.n_years, k)[:, 1:])
+
+
+def quintile_count_frame(panel):
+    # Long frame (year, quintile_label, family_person = # people) for the survey years in the panel
+    counts = quintile_counts(panel)
+    surveyed = counts.sum(axis=1) > 0
+    k = len(panel.quintile_options)
+    return pd.DataFrame({
+        'year': np.repeat(panel.years[surveyed].astype(np.int64), k),
+        'quintile_label': pd.Categorical(np.tile(panel.quintile_options, surveyed.sum()),
+                                         categories=list(panel.quintile_options), ordered=True),
+        'family_person': counts[surveyed].ravel(),
+    })
+
+
+@lru_cache(maxsize=4)
+def transition_matrices(panel):
+    # -> ([(year, next survey year)], (pair x K x K) counts): row = quintile in the earlier year,
+    # column = quintile in the next survey year, over people observed in both
+    k = len(panel.quintile_options)
+    surveyed = np.flatnonzero((panel.codes > 0).any(axis=0))
+    pairs = [(int(panel.years[a]), int(panel.years[b])) for a, b in zip(surveyed[:-1], surveyed[1:])]
+    before = panel.codes[:, surveyed[:-1]].astype(np.int64)
+    after = panel.codes[:, surveyed[1:]].astype(np.int64)
+    both = (before > 0) & (after > 0)
+    pair = np.broadcast_to(np.arange(len(pairs)), before.shape)
+    cells = (pair * k + before - 1) * k + after - 1
+    counts = np.bincount(cells[both], minlength=len(pairs) * k * k)
+    return pairs, _frozen(counts.reshape(len(pairs), k, k))
+
+
+@lru_cache(maxsize=64)
+def lagged_transitions(panel, lag):
+    # -> (start years, (start year x K x K) counts): quintile in year t (row) vs in calendar year t + lag
+    # (column), i.e. the panel self-joined on year + lag in one pass. Memoized per lag; pool with .sum(axis=0).
+    k = len(panel.quintile_options)
+    lag = int(lag)
+    if not 1 <= lag < panel.n_years:
+        return panel.years[:0], _frozen(np.zeros((0, k, k), dtype=np.int64))
+    before = panel.codes[:, :-lag].astype(np.int64)
+    after = panel.codes[:, lag:].astype(np.int64)
+    both = (before > 0) & (after > 0)
+    start = np.broadcast_to(np.arange(before.shape[1]), before.shape)
+    cells = (start * k + before - 1) * k + after - 1
+    counts = np.bincount(cells[both], minlength=before.shape[1] * k * k)
+    return panel.years[:-lag], _frozen(counts.reshape(before.shape[1], k, k))
+
+
+def transition_probabilities(counts):
+    # Row-normalize (..., K, K) transition counts; rows without anyone stay 0
+    totals = counts.sum(axis=-1, keepdims=True)
+    return np.divide(counts, totals, out=np.zeros(counts.shape), where=totals > 0)
+
+
+# --- Robust mobility (hope.py) ---
+# backend="numpy" is the bitmask engine below; "numba" runs kernels.robust_scan (same results) and quietly
+# falls back to numpy when numba isn't installed; "runs" answers every start year by a binary search in the
+# goal_spans run-length index
+BACKENDS = ("numpy", "numba", "runs")
+
+
+def _span_hits(panel, goal_range, people, cols, time_horizon, consec_years):
+    # Boolean per (person code, start column) pair: one goal run covers the consec_years calendar years
+    # from col + time_horizon -- the last run starting at or before that year, found by binary search
+    keys, lengths = goal_spans(panel, tuple(goal_range))
+    target = np.asarray(cols, dtype=np.int64) + time_horizon
+    probe = np.asarray(people, dtype=np.int64) * panel.n_years + target
+    i = np.searchsorted(keys, probe, side='right') - 1
+    fits = (i >= 0) & (target + consec_years <= panel.n_years)
+    i = np.maximum(i, 0)
+    if not len(keys):
+        return np.zeros(len(probe), dtype=bool)
+    return fits & (keys[i] // max(panel.n_years, 1) == people) & (keys[i] + lengths[i] >= probe + consec_years)
+
+
+def person_windows(panel, pid, start_quintile_range, goal_quintile_range, time_horizon, consec_years,
+                   restrict_start_year=None):
+    # -> [(start_year, first_goal_year, last_goal_year)] for ONE person from the run-length index: what
+    # AchieverWindows.of returns, for results that carry no windows (cube, debug loops) without re-running
+    # an engine over everyone
+    code = int(np.searchsorted(panel.ids, pid))
+    if code >= len(panel.ids) or panel.ids[code] != pid or not panel.n_years:
+        return []
+    time_horizon, consec_years = int(time_horizon), int(consec_years)
+    cols = np.flatnonzero(range_lookup(start_quintile_range, list(panel.quintile_options))[panel.codes[code]])
+    if restrict_start_year is not None:
+        cols = cols[panel.years[cols] == int(restrict_start_year)]
+    hits = cols[_span_hits(panel, goal_quintile_range, np.full(len(cols), code), cols, time_horizon, consec_years)]
+    return [(sy, sy + time_horizon, sy + time_horizon + consec_years - 1) for sy in panel.years[hits].tolist()]
+
+
+def robust_populations(panel, start_quintile_range, goal_quintile_range, time_horizon, consec_years,
+                       restrict_start_year=None, year_range=None, backend="numpy"):
+    # -> (achievers, denominator) as PersonSets + the achievers' qualifying windows
+    if year_range is not None:
+        panel = panel.between(*year_range)
+    time_horizon, consec_years = int(time_horizon), int(consec_years)
+    restrict = None if restrict_start_year is None else int(restrict_start_year)
+    if restrict is not None and backend == "numpy":
+        # Specific start year: the restriction is pushed down to that year's cohort instead of building
+        # full-panel start/window stages and discarding every other start year
+        col, cohort = cohort_stage(panel, tuple(start_quintile_range), restrict)
+        span = time_horizon + consec_years - 1
+        denominator = np.zeros(panel.codes.shape[0], dtype=bool)
+        if col is not None:
+            denominator[cohort[last_column(panel)[cohort] >= col + span]] = True
+        hit_bits = _cohort_hits(panel, cohort, col, goal_quintile_range, (col or 0) + time_horizon, consec_years)
+        return (PersonSet.from_mask(panel.ids, hit_bits != 0), PersonSet.from_mask(panel.ids, denominator),
+                AchieverWindows.from_hits(panel, hit_bits, time_horizon, consec_years))
+    if backend == "runs":
+        # Every (person, start column) pair checked against the goal-span index
+        if restrict is None:
+            people, cols, first_start = start_pairs(panel, tuple(start_quintile_range))
+        else:
+            col, people = cohort_stage(panel, tuple(start_quintile_range), restrict)
+            cols = np.full(len(people), -1 if col is None else col)
+            first_start = np.full(panel.codes.shape[0], -1, dtype=np.int64)
+            first_start[people] = cols
+        denominator = (first_start >= 0) & (first_start + time_horizon + consec_years - 1 <= last_column(panel))
+        ok = np.flatnonzero(_span_hits(panel, goal_quintile_range, people, cols, time_horizon, consec_years))
+        # Pairs are sorted by person: OR each achiever's start-year bits together in one reduceat
+        hit_bits = np.zeros(panel.codes.shape[0], dtype=np.uint64)
+        if len(ok):
+            owners = people[ok]
+            first = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+            hit_bits[owners[first]] = np.bitwise_or.reduceat(np.uint64(1) << cols[ok].astype(np.uint64), first)
+        return (PersonSet.from_mask(panel.ids, hit_bits != 0), PersonSet.from_mask(panel.ids, denominator),
+                AchieverWindows.from_hits(panel, hit_bits, time_horizon, consec_years))
+    if backend == "numba" and kernels.HAVE_NUMBA:
+        offsets, years, codes = panel_rows(panel)
+        opts = list(panel.quintile_options)
+        denominator, hit_bits = kernels.robust_scan(
+            offsets, years, codes, range_lookup(start_quintile_range, opts), range_lookup(goal_quintile_range, opts),
+            time_horizon, consec_years, -1 if restrict is None else restrict,
+            int(panel.years[0]) if panel.n_years else 0)
+        return (PersonSet.from_mask(panel.ids, hit_bits != 0), PersonSet.from_mask(panel.ids, denominator),
+                AchieverWindows.from_hits(panel, hit_bits, time_horizon, consec_years))
+    start_bits, first_start = start_stage(panel, tuple(start_quintile_range), restrict)
+    window_bits = window_stage(panel, tuple(goal_quintile_range), consec_years)
+
+    # Denominator: still observed at (earliest start) + horizon + window - 1
+    span = time_horizon + consec_years - 1
+    denominator = (first_start >= 0) & (first_start + span <= last_column(panel))
+    # Achiever: some start year t whose window begins at t + horizon (every such t is kept for the plot)
+    hit_bits = start_bits & _shift_down(window_bits, time_horizon)
+
+    return (PersonSet.from_mask(panel.ids, hit_bits != 0), PersonSet.from_mask(panel.ids, denominator),
+            AchieverWindows.from_hits(panel, hit_bits, time_horizon, consec_years))
+
+
+def robust_achievers(panel, start_quintile_range, goal_quintile_range, time_horizon, consec_years,
+                     restrict_start_year=None, year_range=None, backend="numpy"):
+    # -> (achievers, n_achievers, n_total, windows)
+    achievers, denominator, windows = robust_populations(panel, start_quintile_range, goal_quintile_range,
+                                                         time_horizon, consec_years, restrict_start_year,
+                                                         year_range, backend)
+    return achievers, len(achievers), len(denominator), windows
+
+
+def robust_surface(panel, start_quintile_range, goal_quintile_range, max_horizon, max_window,
+                   restrict_start_year=None):
+    # -> (n_achievers, n_total), int64 arrays of shape (max_horizon, max_window) with [h - 1, c - 1] equal to
+    # robust_achievers(..., time_horizon=h, consec_years=c)'s counts -- the whole sweep from one pass:
+    #   achiever: the longest goal run starting exactly h years after one of the person's starts is >= c
+    #   denominator: (last observed column - earliest start column) >= h + c - 1
+    runs = goal_runs(panel, tuple(goal_quintile_range))
+    n_people, n_years = runs.shape
+    if restrict_start_year is None:
+        first_start = start_stage(panel, tuple(start_quintile_range))[1]
+        members = np.flatnonzero(first_start >= 0)
+        starts = panel.mask(list(start_quintile_range))[members]
+    else:
+        # Pushed down to the start year's cohort, like robust_populations
+        col, members = cohort_stage(panel, tuple(start_quintile_range), int(restrict_start_year))
+        first_start = np.full(n_people, -1 if col is None else col)
+        starts = np.zeros((len(members), n_years), dtype=bool)
+        if col is not None:
+            starts[:, col] = True
+    runs = runs[members]
+    # best_run[:, h - 1] = longest goal run beginning h years after some start (0/1 int8 starts x runs)
+    starts = np.ascontiguousarray(starts).view(np.int8)
+    best_run = np.zeros((len(members), max_horizon), dtype=np.int8)
+    for h in range(1, min(max_horizon, n_years - 1) + 1):
+        best_run[:, h - 1] = (starts[:, :n_years - h] * runs[:, h:]).max(axis=1, initial=0)
+    # Per horizon, a histogram of the best run (capped at max_window) counted from the top gives every c
+    capped = np.minimum(best_run, max_window).astype(np.int64) + np.arange(max_horizon) * (max_window + 1)
+    hist = np.bincount(capped.ravel(), minlength=max_horizon * (max_window + 1)).reshape(max_horizon, -1)
+    n_achievers = np.cumsum(hist[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    windows = np.arange(1, max_window + 1)
+    # Denominator: histogram of the observed span after the earliest start, then a reverse cumulative count
+    slack = last_column(panel)[members] - first_start[members]
+    at_least = np.cumsum(np.bincount(np.maximum(slack, 0), minlength=n_years + 1)[::-1])[::-1]
+    spans = np.arange(1, max_horizon + 1)[:, None] + windows[None, :] - 1
+    n_total = np.where(spans < len(at_least), at_least[np.minimum(spans, len(at_least) - 1)], 0)
+    return n_achievers.astype(np.int64), n_total.astype(np.int64)
+
+
+# --- Ever reached (hope.py) ---
+def period_keys(panel, periods):
+    # One uint64 column mask per (lo, hi) period (None = every year): the per-period group key
+    cols = np.arange(panel.n_years, dtype=np.uint64)
+    keys = np.zeros(len(periods), dtype=np.uint64)
+    for k, period in enumerate(periods):
+        inside = np.ones(panel.n_years, dtype=bool) if period is None else \
+            (panel.years >= int(period[0])) & (panel.years <= int(period[1]))
+        keys[k] = np.bitwise_or.reduce(np.uint64(1) << cols[inside]) if inside.any() else 0
+    return keys
+
+
+def ever_reached_periods(panel, start_range, goal_range, periods):
+    # -> [(reached, total, reached PersonSet)] per period, all periods from one pass over the cached
+    # full-panel start/goal bits: "any year in the period" is (bits & period key) != 0
+    keys = period_keys(panel, periods)
+    start_bits = start_stage(panel, tuple(start_range))[0]
+    goal_bits = goal_stage(panel, tuple(goal_range))
+    total = (start_bits[:, None] & keys) != 0
+    reached = total & ((goal_bits[:, None] & keys) != 0)
+    n_reached, n_total = reached.sum(axis=0), total.sum(axis=0)
+    return [(int(n_reached[k]), int(n_total[k]), PersonSet.from_mask(panel.ids, reached[:, k]))
+            for k in range(len(keys))]
+
+
+def ever_reached(panel, start_range, goal_range, year_range=None):
+    return ever_reached_periods(panel, start_range, goal_range, [year_range])[0]
+
+
+# --- Period comparisons (any list of year windows, e.g. rolling decades) ---
+def rolling_periods(first_year, last_year, length, stride):
+    # [(lo, hi)] windows of `length` survey years every `stride` years that fit in first_year..last_year
+    length, stride = int(length), max(int(stride), 1)
+    return [(lo, lo + length - 1) for lo in range(int(first_year), int(last_year) - length + 2, stride)]
+
+
+def _low_bit(bits):
+    # Index of the lowest set bit of each uint64 (-1 for 0); the isolated bit is a power of two, so log2 is exact
+    low = bits & (~bits + np.uint64(1))
+    return np.where(bits != 0, np.log2(np.maximum(low, np.uint64(1)).astype(np.float64)).astype(np.int64), -1)
+
+
+def _high_bit(bits):
+    # Index of the highest set bit of each uint64 (-1 for 0), by halving -- exact for all 64 bits
+    out = np.zeros(bits.shape, dtype=np.int64)
+    rest = bits.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = rest >= (np.uint64(1) << np.uint64(shift))
+        rest = np.where(big, rest >> np.uint64(shift), rest)
+        out += big * shift
+    return np.where(bits != 0, out, -1)
+
+
+def robust_periods(panel, start_range, goal_range, time_horizon, consec_years, periods):
+    # -> [(n_achievers, n_total, achiever PersonSet)] per (lo, hi) period -- the same as robust_achievers on
+    # panel.between(lo, hi) for each period, but every period comes from one pass over the cached full-panel
+    # start/window bits, masked by the period keys instead of re-slicing the panel per period
+    time_horizon, consec_years = int(time_horizon), int(consec_years)
+    keys = period_keys(panel, periods)
+    start_bits = start_stage(panel, tuple(start_range))[0][:, None] & keys
+    # A goal window starting at column t belongs to the period when its last year t + C - 1 does too
+    fits = keys & (keys >> np.uint64(consec_years - 1))
+    window_bits = window_stage(panel, tuple(goal_range), consec_years)[:, None] & fits
+    hits = start_bits & _shift_down(window_bits, time_horizon)
+    # Denominator per period: earliest start in the period + horizon + window - 1 <= last year observed in it
+    first_start = _low_bit(start_bits)
+    last = _high_bit(panel.present[:, None] & keys)
+    denominator = (first_start >= 0) & (first_start + time_horizon + consec_years - 1 <= last)
+    achieved = hits != 0
+    n_achieved, n_total = achieved.sum(axis=0), denominator.sum(axis=0)
+    return [(int(n_achieved[k]), int(n_total[k]), PersonSet.from_mask(panel.ids, achieved[:, k]))
+            for k in range(len(keys))]
+
+
+# --- Bootstrap intervals for n_achievers / n_total ---
+# Resampling people with replacement: only the n_total denominator people matter (everyone else adds 0/0),
+# and achievers are a subset of them, so a resample of n_total people is fully described by how many
+# achievers it draws -- Binomial(n_total, n_achievers / n_total). One binomial draw per resample and cell is
+# therefore the same distribution as explicit multinomial person weights over the engine's indicator
+# vectors, at O(cells x resamples) instead of O(people x resamples).
+BOOTSTRAP_RESAMPLES = 2000
+CI_LEVELS = (0.80, 0.90, 0.95, 0.99)   # the dashboards' confidence-level choices
+
+
+def bootstrap_intervals(n_achievers, n_total, level=0.95, n_resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    # -> (lower, upper) percentile-bootstrap bounds of the probability per cell (NaN where n_total is 0).
+    # A fixed seed keeps the interval stable across reruns with the same counts.
+    n_achievers = np.atleast_1d(np.asarray(n_achievers, dtype=np.int64))
+    n_total = np.atleast_1d(np.asarray(n_total, dtype=np.int64))
+    p = np.divide(n_achievers, n_total, out=np.zeros(len(n_total)), where=n_total > 0)
+    draws = np.random.default_rng(seed).binomial(n_total[:, None], p[:, None], size=(len(n_total), n_resamples))
+    tail = (1 - level) / 2
+    lower, upper = np.quantile(draws / np.maximum(n_total, 1)[:, None], [tail, 1 - tail], axis=1)
+    empty = n_total == 0
+    lower[empty] = upper[empty] = np.nan
+    return lower, upper
+
+
+def interval_text(n_achievers, n_total, level=0.95, digits=1):
+    # "95% CI: a – b" for one probability, "" without a denominator. Every resample of an all-or-nothing
+    # cell (0 or n_total of n_total) is identical, so its interval is a point -- say so rather than imply
+    # certainty
+    if not n_total:
+        return ""
+    lower, upper = bootstrap_intervals(n_achievers, n_total, level=level)
+    text = f"{level:.0%} CI: {lower[0]:.{digits}%} – {upper[0]:.{digits}%}"
+    if n_achievers in (0, n_total):
+        text += " -- an all-or-nothing cell, so the interval collapses to a point"
+    return text
+
+
+# --- Single-year horizon mobility (layout.py) ---
+def horizon_achievers(panel, start_quintile_range, goal_quintile_range, time_horizon, start_year=None):
+    time_horizon = int(time_horizon)
+    if start_year is not None:
+        # Specific start year: only that year's cohort and its goal year are read (see cohort_stage)
+        col, cohort = cohort_stage(panel, tuple(start_quintile_range), int(start_year))
+        n_total = len(cohort)
+        hit_bits = _cohort_hits(panel, cohort, col, goal_quintile_range, (col or 0) + time_horizon, 1)
+    else:
+        start_bits, first_start = start_stage(panel, tuple(start_quintile_range))
+        # Anyone with a possible start counts in the denominator
+        n_total = int((first_start >= 0).sum())
+        hit_bits = start_bits & _shift_down(goal_stage(panel, tuple(goal_quintile_range)), time_horizon)
+    # -> (achievers, n_achievers, n_total, windows): the (start, goal) pairs stay as start-year bits
+    # (a one-year window) and are only expanded for the person being plotted, see AchieverWindows.of
+    achievers = PersonSet.from_mask(panel.ids, hit_bits != 0)
+    return achievers, len(achievers), n_total, AchieverWindows.from_hits(panel, hit_bits, time_horizon, 1)
+
+
+# --- Reference implementations (original per-person loops, kept for parity checks) ---
+def robust_achievers_reference(df, start_quintile_range, goal_quintile_range, time_horizon, consec_years,
+                               quintile_options=QUINTILE_OPTIONS, restrict_start_year=None):
+    df = df[df['quintile_label'].isin(quintile_options)].copy()
+    df = df.sort_values(["family_person", "year"])
+    robust_set = set()
+    valid_denominator = set()
+    for pid, group in df.groupby("family_person"):
+        years = group['year'].values
+        quintiles = group['quintile_label'].values
+        start_years = years[np.isin(quintiles, start_quintile_range)]
+        if restrict_start_year is not None:
+            start_years = [y for y in start_years if y == restrict_start_year]
+        if len(start_years) == 0:
+            continue
+        for start_year in start_years:
+            end_year = start_year + time_horizon + consec_years - 1
+            if years[-1] < end_year:
+                continue
+            valid_denominator.add(pid)
+            target_years = np.arange(start_year + time_horizon, start_year + time_horizon + consec_years)
+            if not np.all(np.isin(target_years, years)):
+                continue
+            mask = np.isin(years, target_years)
+            if np.all([q in goal_quintile_range for q in quintiles[mask]]):
+                robust_set.add(pid)
+                break
+    return list(robust_set), len(robust_set), len(valid_denominator)
+
+
+def ever_reached_reference(df, start_range, goal_range, quintile_options=QUINTILE_OPTIONS):
+    reached = 0
+    total = 0
+    reached_ids = []
+    df_filtered = df[df['quintile_label'].isin(quintile_options)]
+    for pid, group in df_filtered.groupby("family_person"):
+        quintiles = group.sort_values("year")['quintile_label'].values
+        if any(q in start_range for q in quintiles):
+            total += 1
+            if any(q in goal_range for q in quintiles):
+                reached += 1
+                reached_ids.append(pid)
+    return reached, total, reached_ids
+
+
+def horizon_achievers_reference(df, start_quintile_range, goal_quintile_range, time_horizon, start_year=None,
+                                quintile_options=QUINTILE_OPTIONS):
+    df = df[df['quintile_label'].isin(quintile_options)].sort_values(["family_person", "year"])
+    achievers = []
+    denominator = set()
+    achievers_map = dict()
+    for pid, group in df.groupby("family_person"):
+        years = group['year'].values
+        quintiles = group['quintile_label'].values
+        if start_year is None:
+            possible_starts = years[np.isin(quintiles, start_quintile_range)]
+        else:
+            mask = (years == int(start_year)) & np.isin(quintiles, start_quintile_range)
+            possible_starts = years[mask]
+        if len(possible_starts) == 0:
+            continue
+        found_windows = []
+        for sy in possible_starts:
+            goal_y = sy + time_horizon
+            if goal_y not in years:
+                continue
+            idx = np.where(years == goal_y)[0][0]
+            denominator.add(pid)
+            if quintiles[idx] in goal_quintile_range:
+                found_windows.append((sy, goal_y))
+        if found_windows:
+            achievers.append(pid)
+            achievers_map[pid] = found_windows
+        elif len(possible_starts) > 0:
+            denominator.add(pid)
+    return achievers, len(achievers), len(denominator), achievers_map
+
+
+# --- Sharded execution of the reference loops ---
+# For paths the vectorized engine doesn't cover (debug mode, custom window rules): people are split into
+# shards by a stable hash of family_person, each shard runs the per-person loop in a worker process, and
+# the partial results are merged in sorted-ID order so the output doesn't depend on the worker count.
+def shard_people(df, n_shards):
+    person_codes, ids = pd.factorize(df['family_person'])
+    shard_of_id = np.fromiter((zlib.crc32(str(pid).encode()) % n_shards for pid in ids),
+                              dtype=np.int64, count=len(ids))
+    row_shard = shard_of_id[person_codes]
+    return [df[row_shard == k] for k in range(n_shards)]
+
+
+def _merge_robust(parts):
+    ids = sorted(set().union(*(p[0] for p in parts)))
+    return ids, sum(p[1] for p in parts), sum(p[2] for p in parts)
+
+
+def _merge_ever(parts):
+    ids = sorted(pid for p in parts for pid in p[2])
+    return sum(p[0] for p in parts), sum(p[1] for p in parts), ids
+
+
+def _merge_horizon(parts):
+    windows = {}
+    for p in parts:
+        windows.update(p[3])
+    achievers = sorted(windows)
+    return achievers, len(achievers), sum(p[2] for p in parts), {pid: windows[pid] for pid in achievers}
+
+
+REFERENCE_CALCULATORS = {
+    "robust": (robust_achievers_reference, _merge_robust),
+    "ever": (ever_reached_reference, _merge_ever),
+    "horizon": (horizon_achievers_reference, _merge_horizon),
+}
+
+
+# ONE fixed-size worker pool per server process, shared by every session and only shut down at exit:
+# the requested worker count sets the number of shards, never the pool, so no session can find the
+# pool it submits to shut down by another
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the Streamlit server is multi-threaded
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+@atexit.register
+def _shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def run_sharded(kind, df, *args, workers=None, **kwargs):
+    func, merge = REFERENCE_CALCULATORS[kind]
+    workers = max(int(workers or os.cpu_count() or 1), 1)
+    # Plain object columns: smaller pickles than the full frame, and categoricals would make the
+    # per-person groupby walk every (empty) category
+    data = df[['family_person', 'year', 'quintile_label']].astype({'family_person': object,
+                                                                     'quintile_label': object})
+    shards = shard_people(data, workers)
+    if workers == 1:
+        parts = [func(shards[0], *args, **kwargs)]
+    else:
+        pool = _process_pool()
+        parts = [f.result() for f in [pool.submit(func, shard, *args, **kwargs) for shard in shards]]
+    return merge(parts)
+
@@ -0,0 +1,116 @@
+# Binary data cache (dataset.load_frame / open_frame): stamp + hash invalidation, the CURRENT pointer
+# swap with pruning, the reader retry, and the dtype round trip, on a small temporary CSV.
+#
+#   python -m pytest -q
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataset  # noqa: E402
+from mobility import QUINTILE_OPTIONS  # noqa: E402
+
+
+def _write_csv(path, income_scale=1.0, seed=3):
+    # dream_92.csv's layout: ids, year, income, the per-year thresholds clean.R joins on, and the labels
+    rng = np.random.default_rng(seed)
+    rows = []
+    for p in range(12):
+        for year in range(1990, 1998):
+            rows.append({"ER30001": 100 + p, "ER30002": p, "year": year,
+                         "head_labor_income": float(rng.integers(1000, 90000)) * income_scale,
+                         "family_person": f"{100 + p}_{p}",
+                         "quintile": float(rng.integers(1, 6)), "quintile_label": QUINTILE_OPTIONS[p % 5]})
+    df = pd.DataFrame(rows)
+    for i, col in enumerate(dataset.THRESHOLD_COLS):
+        df[col] = (df["year"] - 1900) * 100.0 * (i + 1)
+    # Unsorted rows, like the CSV clean.R writes
+    df.sample(frac=1, random_state=seed).to_csv(path, index=False)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / "dream.csv")
+    _write_csv(path)
+    return path
+
+
+def _version(path):
+    return dataset.current_version(dataset.cache_dir(path))
+
+
+def test_rebuild_when_contents_change(csv_path):
+    first = dataset.load_frame(csv_path)
+    old_version = _version(csv_path)
+    _write_csv(csv_path, income_scale=2.0)
+    second = dataset.load_frame(csv_path)
+    assert _version(csv_path) != old_version
+    # The old version was pruned
+    assert not os.path.exists(old_version)
+    np.testing.assert_allclose(second["head_labor_income"].to_numpy(),
+                               2 * first["head_labor_income"].to_numpy(), rtol=1e-6)
+
+
+def test_touch_refreshes_the_stamp_without_rebuilding(csv_path, monkeypatch):
+    dataset.load_frame(csv_path)
+    version = _version(csv_path)
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def no_rebuild(*args, **kwargs):
+        raise AssertionError("the CSV was re-read")
+    monkeypatch.setattr(dataset.pd, "read_csv", no_rebuild)
+    dataset.load_frame(csv_path)
+    assert _version(csv_path) == version
+    assert dataset._read_meta(dataset.cache_dir(csv_path))["source"] == dataset._source_stamp(csv_path)
+
+
+def test_reader_resolves_current_after_a_concurrent_rebuild(csv_path, monkeypatch):
+    dataset.load_frame(csv_path)
+    cdir = dataset.cache_dir(csv_path)
+    stale = _version(csv_path)
+    read_cache = dataset.read_cache
+    calls = []
+
+    def racing_read_cache(meta, mmap=False):
+        # Another session publishes a rebuild (pruning the version this reader resolved) right before the read
+        if not calls:
+            rebuilt = read_cache(meta).assign(head_labor_income=np.float32(-1))
+            dataset.write_cache(rebuilt, cdir, dataset._source_stamp(csv_path), dataset._file_hash(csv_path),
+                                dataset.load_thresholds(csv_path))
+        calls.append(meta["dir"])
+        return read_cache(meta, mmap)
+    monkeypatch.setattr(dataset, "read_cache", racing_read_cache)
+    df = dataset.open_frame(csv_path)
+    assert calls[0] == stale and calls[-1] == _version(csv_path) != stale
+    assert (df["head_labor_income"] == -1).all()
+
+
+def test_dtype_round_trip(csv_path):
+    raw = pd.read_csv(csv_path).sort_values(["family_person", "year"]).reset_index(drop=True)
+    built = dataset.load_frame(csv_path)
+    df = dataset.open_frame(csv_path)
+    for frame in (built, df):
+        assert frame["year"].dtype == np.int16
+        assert frame["head_labor_income"].dtype == np.float32
+        assert isinstance(frame["quintile_label"].dtype, pd.CategoricalDtype)
+        assert list(frame["quintile_label"].cat.categories[:len(QUINTILE_OPTIONS)]) == QUINTILE_OPTIONS
+        assert isinstance(frame["family_person"].dtype, pd.CategoricalDtype)
+        assert not set(dataset.THRESHOLD_COLS) & set(frame.columns)
+        np.testing.assert_array_equal(frame["year"].to_numpy(), raw["year"].to_numpy())
+        np.testing.assert_array_equal(frame["family_person"].astype(str).to_numpy(), raw["family_person"].to_numpy())
+        np.testing.assert_array_equal(frame["quintile_label"].astype(str).to_numpy(), raw["quintile_label"].to_numpy())
+        np.testing.assert_allclose(frame["head_labor_income"].to_numpy(), raw["head_labor_income"].to_numpy(),
+                                   rtol=1e-6)
+    # The mapped frame is backed by the cache files, not a private copy
+    values = df["head_labor_income"].to_numpy()
+    while not isinstance(values, np.memmap) and values.base is not None:
+        values = values.base
+    assert isinstance(values, np.memmap)
+    thresholds = dataset.load_thresholds(csv_path)
+    assert thresholds["year"].tolist() == list(range(1990, 1998))
+    assert list(thresholds.columns) == ["year"] + dataset.THRESHOLD_COLS
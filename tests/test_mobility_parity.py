@@ -0,0 +1,142 @@
+# Parity of the vectorized mobility engine with the original per-person loops (mobility.*_reference)
+# on a small synthetic panel with gaps, unlabelled rows and a survey year nobody was observed in.
+#
+#   python -m pytest -q
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mobility  # noqa: E402
+
+Q = mobility.QUINTILE_OPTIONS
+FIRST_YEAR, LAST_YEAR = 1968, 1995
+EMPTY_YEAR = 1980   # in the panel's year range, but no rows at all
+RANGES = [
+    [Q[0]], [Q[-1]], [Q[2]],   # Exact
+    Q[:2], Q[:3],              # No higher than
+    Q[3:], Q[2:],              # No lower than
+]
+START_GOAL = [(s, g) for s in RANGES[::2] for g in RANGES[1::2]]
+START_YEARS = [None, 1970, 1975, EMPTY_YEAR, 1990, 2010]
+YEAR_RANGES = [None, (1970, 1985), (1978, 1995)]
+
+
+def _synthetic_frame(n_people=80, seed=7):
+    # Sticky quintile paths (people mostly stay near their last quintile) so achievers exist at every
+    # horizon; each person is observed over a random stretch with random gaps, and a few rows carry a
+    # label outside QUINTILE_OPTIONS (dropped by both the panel and the loops)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for p in range(n_people):
+        first = int(rng.integers(FIRST_YEAR, LAST_YEAR - 5))
+        last = int(rng.integers(first + 3, LAST_YEAR + 1))
+        q = int(rng.integers(0, len(Q)))
+        for year in range(first, last + 1):
+            q = int(np.clip(q + rng.choice([-1, 0, 0, 0, 1]), 0, len(Q) - 1))
+            if year == EMPTY_YEAR or rng.random() < 0.1:
+                continue
+            label = "unknown" if rng.random() < 0.03 else Q[q]
+            rows.append((f"{p % 37}_{p}", year, label))
+    return pd.DataFrame(rows, columns=["family_person", "year", "quintile_label"])
+
+
+@pytest.fixture(scope="module")
+def frame():
+    return _synthetic_frame()
+
+
+@pytest.fixture(scope="module")
+def panel(frame):
+    return mobility.build_panel(frame)
+
+
+def _between(df, year_range):
+    return df if year_range is None else df[df['year'].between(*year_range)]
+
+
+@pytest.mark.parametrize("start_range, goal_range", START_GOAL)
+@pytest.mark.parametrize("time_horizon, consec_years", [(1, 1), (3, 2), (5, 3), (10, 1)])
+def test_robust_achievers(frame, panel, start_range, goal_range, time_horizon, consec_years):
+    # Every backend against one reference run per (year range, start year)
+    for year_range in YEAR_RANGES:
+        df = _between(frame, year_range)
+        for start_year in START_YEARS:
+            ids, n_ach, n_tot = mobility.robust_achievers_reference(
+                df, start_range, goal_range, time_horizon, consec_years, restrict_start_year=start_year)
+            windows = {}
+            for backend in mobility.BACKENDS:
+                got, got_ach, got_tot, windows[backend] = mobility.robust_achievers(
+                    panel, start_range, goal_range, time_horizon, consec_years,
+                    restrict_start_year=start_year, year_range=year_range, backend=backend)
+                assert (got_ach, got_tot) == (n_ach, n_tot), (backend, year_range, start_year)
+                assert sorted(got) == sorted(ids), (backend, year_range, start_year)
+            # The highlighted windows come from the pass that counted each achiever, so every backend and
+            # the single-person run-length lookup must agree on them ([] for everyone else)
+            period = panel if year_range is None else panel.between(*year_range)
+            for pid in panel.ids:
+                expected = mobility.person_windows(period, pid, start_range, goal_range, time_horizon,
+                                                   consec_years, restrict_start_year=start_year)
+                assert bool(expected) == (pid in ids), (pid, year_range, start_year)
+                for backend, w in windows.items():
+                    assert w.of(pid) == expected, (backend, pid, year_range, start_year)
+
+
+@pytest.mark.parametrize("start_range, goal_range", START_GOAL)
+def test_ever_reached(frame, panel, start_range, goal_range):
+    periods = [(FIRST_YEAR, LAST_YEAR), (1970, 1979), (EMPTY_YEAR, EMPTY_YEAR), (1985, 2000)]
+    results = mobility.ever_reached_periods(panel, start_range, goal_range, periods)
+    for (lo, hi), (reached, total, reached_ids) in zip(periods, results):
+        ref_reached, ref_total, ref_ids = mobility.ever_reached_reference(
+            _between(frame, (lo, hi)), start_range, goal_range)
+        assert (reached, total) == (ref_reached, ref_total), (lo, hi)
+        assert sorted(reached_ids) == sorted(ref_ids), (lo, hi)
+    reached, total, reached_ids = mobility.ever_reached(panel, start_range, goal_range)
+    ref_reached, ref_total, ref_ids = mobility.ever_reached_reference(frame, start_range, goal_range)
+    assert (reached, total, sorted(reached_ids)) == (ref_reached, ref_total, sorted(ref_ids))
+
+
+@pytest.mark.parametrize("start_range, goal_range", START_GOAL)
+@pytest.mark.parametrize("time_horizon, consec_years", [(1, 1), (3, 2), (5, 3)])
+def test_robust_periods(frame, panel, start_range, goal_range, time_horizon, consec_years):
+    # (1970, 1974) is too short for the 5 + 3 - 1 year span, and nobody is observed in EMPTY_YEAR
+    periods = [(FIRST_YEAR, LAST_YEAR), (1970, 1974), (1972, 1986), (EMPTY_YEAR, EMPTY_YEAR), (1983, 2000)]
+    results = mobility.robust_periods(panel, start_range, goal_range, time_horizon, consec_years, periods)
+    assert len(results) == len(periods)
+    for (lo, hi), (n_ach, n_tot, achievers) in zip(periods, results):
+        ids, ref_ach, ref_tot = mobility.robust_achievers_reference(
+            _between(frame, (lo, hi)), start_range, goal_range, time_horizon, consec_years)
+        assert (n_ach, n_tot) == (ref_ach, ref_tot), (lo, hi)
+        assert sorted(achievers) == sorted(ids), (lo, hi)
+
+
+@pytest.mark.parametrize("start_range, goal_range", START_GOAL)
+@pytest.mark.parametrize("time_horizon", [1, 4, 10])
+def test_horizon_achievers(frame, panel, start_range, goal_range, time_horizon):
+    for start_year in START_YEARS:
+        ids, n_ach, n_tot, windows = mobility.horizon_achievers_reference(
+            frame, start_range, goal_range, time_horizon, start_year)
+        got, got_ach, got_tot, got_windows = mobility.horizon_achievers(
+            panel, start_range, goal_range, time_horizon, start_year)
+        assert (got_ach, got_tot) == (n_ach, n_tot), start_year
+        assert sorted(got) == sorted(ids), start_year
+        assert len(got_windows) == n_ach, start_year
+        for pid, w in windows.items():
+            assert [(sy, gy) for sy, gy, _ in got_windows.of(pid)] == [(int(sy), int(gy)) for sy, gy in w]
+
+
+@pytest.mark.parametrize("start_range, goal_range", START_GOAL[::2])
+@pytest.mark.parametrize("start_year", [None, 1975, EMPTY_YEAR])
+def test_robust_surface(frame, panel, start_range, goal_range, start_year):
+    max_horizon, max_window = 6, 3
+    n_ach, n_tot = mobility.robust_surface(panel, start_range, goal_range, max_horizon, max_window, start_year)
+    assert n_ach.shape == n_tot.shape == (max_horizon, max_window)
+    for h in range(1, max_horizon + 1):
+        for c in range(1, max_window + 1):
+            _, ref_ach, ref_tot = mobility.robust_achievers_reference(
+                frame, start_range, goal_range, h, c, restrict_start_year=start_year)
+            assert (n_ach[h - 1, c - 1], n_tot[h - 1, c - 1]) == (ref_ach, ref_tot), (h, c)
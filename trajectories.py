@@ -0,0 +1,105 @@
+# Multi-person trajectory figures and ID picker shared by hope.py and layout.py: one SVG line per person
+# up to WEBGL_THRESHOLD IDs, then ONE WebGL trace (NaN-separated) for the whole selection, or per-year
+# quantile bands, so the payload stays bounded
+import numpy as np
+import plotly.graph_objects as go
+import streamlit as st
+
+import dataset
+import mobility
+
+WEBGL_THRESHOLD = 20
+MAX_TRAJECTORIES = 2000
+BAND_QUANTILES = (0.10, 0.25, 0.50, 0.75, 0.90)
+TRAJECTORY_RENDERERS = ["Auto", "One line per person", "WebGL (single trace)", "Quantile bands"]
+# ID picker: top prefix matches only, filtered by the Mobility Calculator's achievers or first quintile
+ID_SEARCH_LIMIT = 50
+ID_FILTERS = ["Everyone", "Achievers only", "Starts in quintile"]
+
+
+def resolve_renderer(renderer, n_ids):
+    # "Auto" -> one line per person up to WEBGL_THRESHOLD IDs, a single WebGL trace above that
+    if renderer != "Auto":
+        return renderer
+    return TRAJECTORY_RENDERERS[1] if n_ids <= WEBGL_THRESHOLD else TRAJECTORY_RENDERERS[2]
+
+
+def quintile_axis(quintile_options):
+    # -> (y-axis radio option, axis title) for bucket numbers under the active scheme's labels,
+    # e.g. ("Quintile (1–5)", "Income Quintile (1=lowest, 5=top)")
+    k = len(quintile_options)
+    return f"Quintile (1–{k})", f"Income Quintile (1={quintile_options[0]}, {k}={quintile_options[-1]})"
+
+
+def quintile_num(panel, frame):
+    # Bucket number (1..K) of each row under panel's threshold scheme, NaN when unlabelled
+    codes = panel.codes_at(frame['family_person'].to_numpy(), frame['year'].to_numpy())
+    return np.where(codes > 0, codes, np.nan)
+
+
+def trajectory_figure(people, pids, year_range, yvar, renderer, panel=None):
+    # Go figure of yvar (a column of people.frame, or 'quintile_num' read from panel) for many people at
+    # once, gathered straight from the person index
+    pos, lengths = people.positions(pids, year_range)
+    rows = people.frame.iloc[pos]
+    years_col = people.years[pos]
+    values = quintile_num(panel, rows) if yvar == 'quintile_num' else rows[yvar].to_numpy(dtype=np.float64)
+    fig = go.Figure()
+    if renderer == "Quantile bands":
+        ok = ~np.isnan(values)
+        band_years, q = dataset.block_quantiles(years_col[ok], values[ok], BAND_QUANTILES)
+        for (lo, hi), alpha in [((0, 4), 0.15), ((1, 3), 0.3)]:
+            fig.add_trace(go.Scatter(x=band_years, y=q[:, hi], mode='lines', line=dict(width=0),
+                                     showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=band_years, y=q[:, lo], mode='lines', line=dict(width=0), fill='tonexty',
+                                     fillcolor=f'rgba(31, 119, 180, {alpha})',
+                                     name=f"p{BAND_QUANTILES[lo] * 100:g}–p{BAND_QUANTILES[hi] * 100:g}"))
+        fig.add_trace(go.Scatter(x=band_years, y=q[:, 2], mode='lines+markers', name="Median",
+                                 line=dict(color='#1f77b4')))
+    else:
+        x, y, text = dataset.nan_separated(lengths, years_col, values,
+                                           rows['family_person'].to_numpy().astype(object))
+        fig.add_trace(go.Scattergl(x=x, y=y, text=text, mode='lines+markers', connectgaps=False,
+                                   line=dict(width=1), marker=dict(size=3), opacity=0.6,
+                                   name=f"{int((lengths > 0).sum())} people",
+                                   hovertemplate="ID %{text}<br>%{x}: %{y:,}<extra></extra>"))
+    fig.update_layout(template="plotly_white", showlegend=True)
+    return fig
+
+
+def id_picker(people, panel, year_range, quintile_options, achievers, n_achievers):
+    # Searchable ID picker for the trajectory tabs -> selected ids. Only the top prefix matches (plus the
+    # current selection) are sent as options, never every ID observed in the range. The multiselect is keyed
+    # on st.session_state["trajectory_ids"], seeded once with the first matches, so its identity and
+    # selection survive reruns while the options change
+    col_search, col_filter, col_quintile = st.columns([2, 1, 1])
+    with col_search:
+        id_query = st.text_input("Search IDs (family_person starts with):", value="", key="id_search")
+    with col_filter:
+        id_filter = st.selectbox("Show:", ID_FILTERS, index=0, key="id_filter")
+    eligible = people.observed_mask(*year_range)
+    if id_filter == "Achievers only":
+        eligible &= people.id_mask(achievers)
+    elif id_filter == "Starts in quintile":
+        with col_quintile:
+            first_quintile = st.selectbox("First quintile in range:", quintile_options, index=0, key="id_first_quintile")
+        period = panel.between(*year_range)
+        starts_there = mobility.first_codes(period) == quintile_options.index(first_quintile) + 1
+        eligible &= people.id_mask(period.ids[starts_there])
+    matches, n_matches = people.search(id_query, eligible, limit=ID_SEARCH_LIMIT)
+    st.caption(f"{n_matches:,} IDs match; showing the first {len(matches):,}. Type more of an ID to narrow the list.")
+
+    if "trajectory_ids" not in st.session_state:
+        st.session_state["trajectory_ids"] = list(matches[:3])
+    chosen = st.session_state["trajectory_ids"]
+    selected_ids = st.multiselect(
+        "Select individual IDs to visualize:",
+        options=list(dict.fromkeys(list(chosen) + list(matches))),
+        key="trajectory_ids",
+        max_selections=200
+    )
+    if n_achievers > 0 and st.checkbox(
+            f"Add the Mobility Calculator's achievers (up to {MAX_TRAJECTORIES:,} of {n_achievers:,})",
+            value=False, key="overlay_achievers"):
+        selected_ids = list(dict.fromkeys(list(selected_ids) + list(achievers[:MAX_TRAJECTORIES])))
+    return selected_ids
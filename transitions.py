@@ -0,0 +1,63 @@
+# Quintile transition heatmaps of the Matrix Check tab, shared by hope.py and layout.py so the two
+# dashboards cannot drift apart
+import numpy as np
+import plotly.express as px
+import streamlit as st
+
+import mobility
+
+
+def transition_heatmaps(panel, start_year, time_horizon):
+    # Consecutive-survey-year matrix (select slider over year pairs) and the lagged t -> t + lag matrix for
+    # the sidebar start year ("All years" sums every start year); the lag defaults to the time horizon
+    quintile_order = list(panel.quintile_options)
+    # Year-to-year transition matrix between consecutive survey years
+    st.subheader("Quintile Transitions Between Consecutive Survey Years")
+    year_pairs, transition_matrices = mobility.transition_matrices(panel)
+    if year_pairs:
+        pair_labels = [f"{a} → {b}" for a, b in year_pairs]
+        pair_label = st.select_slider("Survey years:", options=pair_labels, value=pair_labels[-1])
+        pair_index = pair_labels.index(pair_label)
+        from_year, to_year = year_pairs[pair_index]
+        counts = transition_matrices[pair_index]
+        fig_transition = px.imshow(
+            mobility.transition_probabilities(counts) * 100,
+            x=quintile_order,
+            y=quintile_order,
+            text_auto='.1f',
+            color_continuous_scale='Blues',
+            labels={'x': f"Quintile in {to_year}", 'y': f"Quintile in {from_year}", 'color': '% of row'},
+            title=f"Quintile Transition Matrix, {from_year} → {to_year} (% of each starting quintile)",
+            template='plotly_white'
+        )
+        st.plotly_chart(fig_transition, use_container_width=True)
+        st.caption(f"{int(counts.sum()):,} people observed in both {from_year} and {to_year}. "
+                   f"Each row sums to 100%.")
+
+    # Lagged transition matrix: quintile in year t vs year t + lag (the time-horizon question)
+    st.subheader("Quintile Transitions After a Time Horizon")
+    lag = st.slider("Lag (years):", min_value=1, max_value=mobility.MAX_HORIZON, value=int(time_horizon))
+    lag_start_years, lag_counts = mobility.lagged_transitions(panel, lag)
+    if start_year == "All years":
+        counts = lag_counts.sum(axis=0)
+        lag_title = f"all start years, t → t + {lag}"
+    else:
+        at = np.flatnonzero(lag_start_years == int(start_year))
+        counts = lag_counts[at[0]] if len(at) else np.zeros((len(quintile_order), len(quintile_order)), dtype=int)
+        lag_title = f"{start_year} → {int(start_year) + lag}"
+    if counts.sum() == 0:
+        st.warning(f"No one is observed in both a start year and {lag} years later for this selection.")
+    else:
+        fig_lag = px.imshow(
+            mobility.transition_probabilities(counts) * 100,
+            x=quintile_order,
+            y=quintile_order,
+            text_auto='.1f',
+            color_continuous_scale='Blues',
+            labels={'x': f"Quintile {lag} years later", 'y': "Quintile in start year", 'color': '% of row'},
+            title=f"Quintile Transition Matrix ({lag_title}; % of each starting quintile)",
+            template='plotly_white'
+        )
+        st.plotly_chart(fig_lag, use_container_width=True)
+        st.caption(f"{int(counts.sum()):,} person-year pairs. Uses the sidebar start year; "
+                   f"the lag defaults to the sidebar time horizon.")